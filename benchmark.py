@@ -0,0 +1,1031 @@
+#!/usr/bin/env python3
+
+# Test command (sh, bash)
+# $ ./benchmark.py dijkstra --sizes 1000 10000 100000
+# $ ./benchmark.py suite --json baseline.json
+# $ ./benchmark.py --profile cprofile suite --cases task3.process_line
+#
+# Legacy implementations are kept here as the reference point for timings.
+
+
+import sys
+import argparse
+import random
+import time
+import copy
+import heapq
+import math
+import tracemalloc
+import subprocess
+import string
+import os
+import io
+import re
+import json
+import platform
+import cProfile
+import pstats
+
+import task1
+import task2
+import task3
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def synthetic_edges(node_count, degree=4, max_distance=100, seed=0):
+    rnd = random.Random(seed)
+    names = ['N%d' % index for index in range(node_count)]
+    for index, node_from in enumerate(names):
+        # The ring keeps every node reachable from every other node
+        yield node_from, names[(index + 1) % node_count], rnd.randint(1, max_distance)
+        for _ in range(degree - 1):
+            yield node_from, rnd.choice(names), rnd.randint(1, max_distance)
+
+
+def synthetic_graph(node_count, degree=4, max_distance=100, seed=0):
+    graph = task1.Graph()
+    for node_from, node_to, distance in synthetic_edges(node_count, degree, max_distance, seed):
+        graph.add_vertex(node_from, node_to, {'distance': distance})
+    return graph, ['N%d' % index for index in range(node_count)]
+
+
+def synthetic_grid(width, max_distance=10, seed=0):
+    # Road-like grid, every edge at least as long as the straight line between its ends
+    rnd = random.Random(seed)
+    graph = task1.Graph()
+    coordinates = dict()
+    for x in range(width):
+        for y in range(width):
+            node = 'G%d_%d' % (x, y)
+            coordinates[node] = (x, y)
+            for x_adj, y_adj in ((x + 1, y), (x, y + 1)):
+                if x_adj < width and y_adj < width:
+                    node_adj = 'G%d_%d' % (x_adj, y_adj)
+                    graph.add_vertex(node, node_adj, {'distance': rnd.randint(1, max_distance)})
+                    graph.add_vertex(node_adj, node, {'distance': rnd.randint(1, max_distance)})
+    return graph, coordinates
+
+
+def synthetic_talks(talk_count, durations=(5, 30, 45, 60), seed=0):
+    rnd = random.Random(seed)
+    talks = list()
+    for index in range(talk_count):
+        duration = rnd.choice(durations)
+        if duration == 5:
+            talks.append(('Talk %d lightning' % index, 'lightning'))
+        else:
+            talks.append(('Talk %d %dmin' % (index, duration), duration))
+    return talks
+
+
+def traced_memory(func, *args, **kwargs):
+    tracemalloc.start()
+    try:
+        result = func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[0], result
+    finally:
+        tracemalloc.stop()
+
+
+def legacy_dijkstra(graph, node_from):
+    graph = type(graph)(copy.deepcopy(graph.nodes), copy.deepcopy(graph.vertex_map))
+    graph.set_node_distance(node_from, 0)
+    unvisited_queue = graph.get_nodes_unvisited()
+    heapq.heapify(unvisited_queue)
+    while len(unvisited_queue):
+        distance, node_current = heapq.heappop(unvisited_queue)
+        graph.set_node_visited(node_current)
+        for node_adj in graph.vertex_map.get(node_current, {}).keys():
+            new_dist = graph.get_node_distance(node_current) + graph.vertex_map[node_current][node_adj]['distance']
+            if new_dist < graph.get_node_distance(node_adj):
+                graph.set_node_distance(node_adj, new_dist)
+                graph.set_node_previous(node_adj, node_current)
+        while len(unvisited_queue):
+            heapq.heappop(unvisited_queue)
+        unvisited_queue = graph.get_nodes_unvisited()
+        heapq.heapify(unvisited_queue)
+    return graph
+
+
+def bench_dijkstra(args):
+    rnd = random.Random(args.seed)
+    for size in args.sizes:
+        graph, names = synthetic_graph(size, seed=args.seed)
+        pairs = [(rnd.choice(names[:args.sources]), rnd.choice(names)) for _ in range(args.queries)]
+        node_from, node_to = pairs[0]
+
+        elapsed_full, search = timed(graph.dijkstra, node_from)
+        elapsed_point, _ = timed(graph.shortest_distance, node_from, node_to)
+        elapsed_batch, _ = timed(graph.shortest_distances, pairs)
+        print('dijkstra nodes=%d full=%.4fs point=%.4fs batch(%d queries, %d sources)=%.4fs' % (
+            size, elapsed_full, elapsed_point, len(pairs), args.sources, elapsed_batch))
+
+        if size > args.legacy_max_nodes:
+            print('dijkstra nodes=%d legacy=skipped (above --legacy-max-nodes)' % size)
+            continue
+        elapsed_legacy, processed = timed(legacy_dijkstra, graph, node_from)
+        for name in names:
+            if processed.get_node_distance(name) != search.get_node_distance(name):
+                raise AssertionError('Distance mismatch', name)
+        print('dijkstra nodes=%d legacy=%.4fs speedup=%.1fx' % (size, elapsed_legacy, elapsed_legacy / elapsed_full))
+
+
+def bench_compact(args):
+    for size in args.sizes:
+        edge_count = size * args.degree
+        memory_graph, (graph, names) = traced_memory(synthetic_graph, size, args.degree, seed=args.seed)
+        elapsed_build, compact = timed(task1.CompactGraph.from_edges, synthetic_edges(size, args.degree, seed=args.seed))
+        memory_compact, compact = traced_memory(task1.CompactGraph.from_edges, synthetic_edges(size, args.degree, seed=args.seed))
+        print('compact nodes=%d edges=%d graph=%.1fMB (%d B/edge) compact=%.1fMB (%d B/edge) build=%.3fs' % (
+            size, edge_count,
+            memory_graph / 2 ** 20, memory_graph // edge_count,
+            memory_compact / 2 ** 20, memory_compact // edge_count,
+            elapsed_build))
+
+        elapsed_graph, search_graph = timed(graph.dijkstra, names[0])
+        elapsed_compact, search_compact = timed(compact.dijkstra, names[0])
+        for name in names[:1000]:
+            if search_graph.get_node_distance(name) != search_compact.get_node_distance(name):
+                raise AssertionError('Distance mismatch', name)
+        print('compact nodes=%d dijkstra graph=%.4fs compact=%.4fs speedup=%.1fx' % (
+            size, elapsed_graph, elapsed_compact, elapsed_graph / elapsed_compact))
+
+        walk = names[:1]
+        for _ in range(args.walk):
+            walk.append(graph.node_name(next(iter(graph.adjacent(walk[-1])))[0]))
+        # Each representation is given its own name objects, as after loading
+        walk_compact = [compact.names[compact.ids[name]] for name in walk]
+        elapsed_graph, distance_graph = timed(graph.distance_nodes, walk)
+        elapsed_compact, distance_compact = timed(compact.distance_nodes, walk_compact)
+        if distance_graph != distance_compact:
+            raise AssertionError('Walk distance mismatch')
+        print('compact nodes=%d distance_nodes(%d) graph=%.4fs compact=%.4fs' % (
+            size, len(walk), elapsed_graph, elapsed_compact))
+
+
+def bench_index(args):
+    rnd = random.Random(args.seed)
+    for size in args.sizes:
+        graph, names = synthetic_graph(size, seed=args.seed)
+        pairs = [(rnd.choice(names), rnd.choice(names)) for _ in range(args.queries)]
+        elapsed_build, index = timed(task1.DistanceIndex.build, graph, args.path)
+        index.close()
+        elapsed_load, index = timed(task1.DistanceIndex.load, args.path, graph)
+        elapsed_lookup, distances = timed(lambda: [index.get_distance(node_from, node_to) for (node_from, node_to) in pairs])
+        elapsed_search, expected = timed(lambda: [graph.shortest_distance(node_from, node_to) for (node_from, node_to) in pairs])
+        index.close()
+        if distances != expected:
+            raise AssertionError('Distance mismatch')
+        print('index nodes=%d build=%.3fs load=%.4fs lookups(%d)=%.4fs dijkstra=%.4fs speedup=%.0fx' % (
+            size, elapsed_build, elapsed_load, len(pairs), elapsed_lookup, elapsed_search, elapsed_search / elapsed_lookup))
+
+
+def bench_dynamic(args):
+    rnd = random.Random(args.seed)
+    for size in args.sizes:
+        graph, names = synthetic_graph(size, seed=args.seed)
+        sources = names[:args.sources]
+        dynamic = task1.DynamicShortestPaths(graph, sources)
+        updates = [(rnd.choice(names), rnd.choice(names), rnd.randint(1, 100)) for _ in range(args.updates)]
+        elapsed_dynamic, _ = timed(lambda: [dynamic.add_vertex(*update) for update in updates])
+        elapsed_full, searches = timed(lambda: [graph.dijkstra(source) for source in sources])
+        for source, search in zip(sources, searches):
+            for name in names[:1000]:
+                if dynamic.get_node_distance(source, name) != search.get_node_distance(name):
+                    raise AssertionError('Distance mismatch', source, name)
+        print('dynamic nodes=%d sources=%d updates=%d per update=%.6fs touched=%.1f nodes, full recompute=%.4fs (%d nodes)' % (
+            size, len(sources), len(updates), elapsed_dynamic / len(updates), dynamic.touched_total / len(updates),
+            elapsed_full, size * len(sources)))
+
+
+def bench_queries(args):
+    rnd = random.Random(args.seed)
+    graph, names = synthetic_graph(args.size, seed=args.seed)
+    graph = graph.freeze()
+    queries = list()
+    for _ in range(args.queries):
+        node_from, node_to = rnd.choice(names), rnd.choice(names)
+        queries.append(rnd.choice([
+            ('shortest', node_from, node_to),
+            ('stops', node_from, node_to, 1, 4),
+            ('within', node_from, node_to, 150),
+        ]))
+    expected = None
+    for workers in args.workers:
+        elapsed, answers = timed(task1.run_queries, graph, queries, workers)
+        if expected is None:
+            expected = answers
+        elif answers != expected:
+            raise AssertionError('Answers differ', workers)
+        print('queries nodes=%d queries=%d workers=%d elapsed=%.3fs (%.0f queries/s)' % (
+            args.size, len(queries), workers, elapsed, len(queries) / elapsed))
+
+
+LOAD_SCRIPT = '''
+import sys, time, task1
+path, edge_format = sys.argv[1:]
+started = time.perf_counter()
+if edge_format == 'legacy':
+    with open(path) as graph_file:
+        task1.Graph.from_str(graph_file.read())
+else:
+    task1.load_graph(path, edge_format)
+elapsed = time.perf_counter() - started
+# ru_maxrss survives exec on Linux and would report the parent, VmHWM does not
+with open('/proc/self/status') as status:
+    peak = [line.split()[1] for line in status if line.startswith('VmHWM:')][0]
+print(elapsed, peak)
+'''
+
+
+def measure_load(path, edge_format):
+    # A fresh process per loader, so peak RSS belongs to that loader only
+    output = subprocess.run(
+        [sys.executable, '-c', LOAD_SCRIPT, path, edge_format],
+        cwd=os.path.dirname(os.path.abspath(task1.__file__)),
+        check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout.split()
+    return float(output[0]), int(output[1])
+
+
+def bench_load(args):
+    rnd = random.Random(args.seed)
+    letters = string.ascii_letters
+    compact_path = os.path.join(args.directory, 'edges.compact')
+    csv_path = os.path.join(args.directory, 'edges.csv')
+    binary_path = os.path.join(args.directory, 'edges.bin')
+    with open(compact_path, 'w') as compact_file:
+        compact_file.write(', '.join(
+            '%s%s%d' % (rnd.choice(letters), rnd.choice(letters), rnd.randint(1, 100)) for _ in range(args.edges)))
+    node_count = max(2, args.edges // 4)
+    with open(csv_path, 'w') as csv_file:
+        for node_from, node_to, distance in synthetic_edges(node_count, 4, seed=args.seed):
+            csv_file.write('%s,%s,%d\n' % (node_from, node_to, distance))
+    task1.load_graph(csv_path, 'csv').save(binary_path)
+
+    for title, path, edge_format in [
+            ('legacy Graph.from_str', compact_path, 'legacy'),
+            ('compact', compact_path, 'compact'),
+            ('csv', csv_path, 'csv'),
+            ('binary', binary_path, 'binary')]:
+        elapsed, rss = measure_load(path, edge_format)
+        print('load edges=%d %s: %.3fs, peak RSS %.1f MB' % (args.edges, title, elapsed, rss / 1024))
+
+
+def bench_route(args):
+    rnd = random.Random(args.seed)
+    for width in args.widths:
+        graph, coordinates = synthetic_grid(width, seed=args.seed)
+        graph = graph.freeze()
+        names = list(coordinates)
+        elapsed_landmarks, landmarks = timed(task1.Landmarks.farthest, graph, args.landmarks)
+        pairs = [(rnd.choice(names), rnd.choice(names)) for _ in range(args.queries)]
+        expected = None
+        for title, strategy, options in [
+                ('dijkstra', 'dijkstra', {}),
+                ('bidirectional', 'bidirectional', {}),
+                ('astar coordinates', 'astar', {'coordinates': coordinates}),
+                ('astar landmarks', 'astar', {'landmarks': landmarks})]:
+            elapsed, routes = timed(lambda: [graph.shortest_route(node_from, node_to, strategy, **options) for (node_from, node_to) in pairs])
+            distances = [route['distance'] for route in routes]
+            if expected is None:
+                expected = distances
+            elif distances != expected:
+                raise AssertionError('Distance mismatch', title)
+            print('route nodes=%d %s: %.4fs/query, settled %.0f/query' % (
+                width * width, title, elapsed / len(pairs), sum(route['settled'] for route in routes) / len(pairs)))
+        print('route nodes=%d landmarks=%d preprocessing=%.3fs' % (width * width, args.landmarks, elapsed_landmarks))
+
+
+def legacy_from_lines(lines):
+    def parser():
+        re_line = re.compile('.*\\b((\\d+)|(lightning)).*')
+        for line in lines:
+            line = line.strip()
+            re_line_match = re_line.match(line)
+            if re_line_match is None:
+                raise AssertionError('Unexpected input', line)
+            duration = re_line_match.group(1)
+            if duration != 'lightning':
+                duration = int(duration)
+            yield line, duration
+    return list(parser())
+
+
+def bench_parse(args):
+    for size in args.sizes:
+        text = ''.join('%s\n' % title for (title, duration) in synthetic_talks(size, seed=args.seed))
+        elapsed_legacy, items = timed(lambda: legacy_from_lines(io.StringIO(text).readlines()))
+        elapsed, schedule_request = timed(task2.ScheduleRequest.from_stream, io.StringIO(text))
+        if schedule_request.items != items:
+            raise AssertionError('Parsed talks differ')
+        memory_legacy, items = traced_memory(lambda: legacy_from_lines(io.StringIO(text).readlines()))
+        memory, schedule_request = traced_memory(task2.ScheduleRequest.from_stream, io.StringIO(text))
+        print('parse talks=%d legacy: %.0f talks/s, %.1f bytes/talk' % (size, size / elapsed_legacy, memory_legacy / float(size)))
+        print('parse talks=%d stream: %.0f talks/s, %.1f bytes/talk' % (size, size / elapsed, memory / float(size)))
+
+
+def bench_schedule(args):
+    def solve(scheduler):
+        try:
+            return '%d tracks' % len(scheduler.solve().tracks)
+        except task2.ScheduleRequestException as e:
+            return e.args[0]
+
+    for durations_text in [args.durations] + args.unschedulable:
+        durations = [int(duration) for duration in durations_text.split(',')]
+        for size in args.sizes:
+            schedule_request = task2.ScheduleRequest(synthetic_talks(size, durations, args.seed))
+            scheduler = task2.Scheduler(schedule_request)
+            elapsed, result = timed(solve, scheduler)
+            print('schedule talks=%d durations=%s: %s, %.3fs, %d patterns explored' % (
+                size, durations_text, result, elapsed, scheduler.explored))
+
+
+def bench_portfolio(args):
+    durations = [int(duration) for duration in args.durations.split(',')]
+    schedule_request = task2.ScheduleRequest(synthetic_talks(args.size, durations, args.seed))
+    for workers in args.workers:
+        try:
+            elapsed, (seed, conference) = timed(task2.solve_portfolio, schedule_request, workers, args.seed, args.budget)
+            result = '%d tracks, strategy seed %s' % (len(conference.tracks), seed)
+        except task2.ScheduleTimeoutException as e:
+            elapsed, result = args.budget, e.args[0]
+        print('portfolio talks=%d workers=%d: %s, %.3fs' % (args.size, workers, result, elapsed))
+
+
+def bench_reschedule(args):
+    durations = [int(duration) for duration in args.durations.split(',')]
+    talks = synthetic_talks(args.size + args.updates, durations, args.seed)
+    conference = task2.Scheduler(task2.ScheduleRequest(talks[:args.size])).solve()
+    rnd = random.Random(args.seed)
+    incremental_elapsed, incremental_changed, solve_elapsed, solve_changed = 0, 0, 0, 0
+    for talk in talks[args.size:]:
+        if rnd.random() < 0.5:
+            elapsed, changed = timed(conference.insert_talk, *talk)
+        else:
+            elapsed, changed = timed(conference.withdraw_talk, *rnd.choice(conference.talks()))
+        if not conference.is_valid():
+            raise AssertionError('Repair left an invalid conference')
+        incremental_elapsed += elapsed
+        incremental_changed += changed
+        before = [sorted(session.items) for session in conference.sessions]
+        elapsed, solved = timed(task2.Scheduler(task2.ScheduleRequest(conference.talks())).solve)
+        after = [sorted(session.items) for session in solved.sessions]
+        solve_elapsed += elapsed
+        solve_changed += sum(1 for (items_before, items_after) in zip(before, after) if items_before != items_after) + abs(len(before) - len(after))
+    print('reschedule talks=%d sessions=%d incremental: %.4fs/update, %.1f sessions changed' % (
+        args.size, len(conference.sessions), incremental_elapsed / args.updates, incremental_changed / float(args.updates)))
+    print('reschedule talks=%d sessions=%d full solve: %.4fs/update, %.1f sessions changed' % (
+        args.size, len(conference.sessions), solve_elapsed / args.updates, solve_changed / float(args.updates)))
+
+
+def synthetic_rates(currency_count, extra_edges=0, seed=0):
+    # (currency_from, value_from, currency_to, value_to): a random tree over the
+    # currencies, plus extra_edges consistent rates of the same tree
+    rnd = random.Random(seed)
+    currencies = ['Cur%d' % index for index in range(currency_count)]
+    values = [rnd.randint(1, 1000) for _ in currencies]
+    rates = list()
+    for index in range(1, currency_count):
+        parent = rnd.randrange(index)
+        rates.append((currencies[index], values[parent], currencies[parent], values[index]))
+    for _ in range(extra_edges):
+        index_from, index_to = rnd.sample(range(currency_count), 2)
+        rates.append((currencies[index_from], values[index_to], currencies[index_to], values[index_from]))
+    return rates
+
+
+def synthetic_converter(rates, **options):
+    converter = task3.Converter(**options)
+    for rate in rates:
+        converter.add_xchg(*rate)
+    return converter
+
+
+class ConverterProcessed(object):
+    # Rate traversal of the original task3.Converter.get_xchg
+    def set_node_rate(self, node, value):
+        self.currencies.setdefault(node, dict())['rate'] = value
+
+    def get_node_rate(self, node):
+        return self.currencies[node].get('rate', math.inf)
+
+    def set_node_previous(self, node, value):
+        self.currencies.setdefault(node, dict())['previous'] = value
+
+    def set_node_visited(self, node):
+        self.currencies.setdefault(node, dict())['visited'] = True
+
+    def get_nodes_unvisited(self):
+        return [(node_options.get('rate', math.inf), node_key) for (node_key, node_options) in self.currencies.items() if not node_options.get('visited', False)]
+
+    def __init__(self, currencies, xchg_graph, currency_from):
+        self.currencies = copy.deepcopy(currencies)
+        self.xchg_graph = copy.deepcopy(xchg_graph)
+
+        # Set the rate to one
+        self.set_node_rate(currency_from, 1)
+
+        # Put tuple pair into the priority queue
+        unvisited_queue = self.get_nodes_unvisited()
+        heapq.heapify(unvisited_queue)
+
+        while len(unvisited_queue):
+            distance, node_current = heapq.heappop(unvisited_queue)
+            self.set_node_visited(node_current)
+            del distance
+
+            for node_adj in self.xchg_graph.get(node_current, {}).keys():
+                if self.xchg_graph[node_current][node_adj].get('visited', False):
+                    continue
+                new_rate = self.get_node_rate(node_current) / self.xchg_graph[node_current][node_adj]['rate']
+                if not math.isinf(new_rate) and math.isinf(self.get_node_rate(node_adj)):
+                    self.set_node_rate(node_adj, new_rate)
+                    self.set_node_previous(node_adj, node_current)
+
+            # Rebuild heap
+            # 1. Pop every item
+            while len(unvisited_queue):
+                heapq.heappop(unvisited_queue)
+
+            # 2. Put all vertices not visited into the queue
+            unvisited_queue = self.get_nodes_unvisited()
+            heapq.heapify(unvisited_queue)
+
+
+def bench_rates(args):
+    rates = synthetic_rates(args.currencies, seed=args.seed)
+    rnd = random.Random(args.seed)
+    currencies = sorted(set(rate[0] for rate in rates) | set(rate[2] for rate in rates))
+    pairs = [tuple(rnd.sample(currencies, 2)) for _ in range(args.pairs)]
+    queries = [rnd.choice(pairs) for _ in range(args.queries)]
+    converter = synthetic_converter(rates)
+    legacy_queries = queries[:args.legacy_queries]
+    elapsed, legacy = timed(lambda: [ConverterProcessed(converter.currencies, converter.xchg_graph, currency_from).get_node_rate(currency_to)
+                                     for (currency_from, currency_to) in legacy_queries])
+    if legacy != [converter.get_rate(currency_from, currency_to) for (currency_from, currency_to) in legacy_queries]:
+        raise AssertionError('Rate mismatch')
+    print('rates currencies=%d legacy traversal: %.6fs/query' % (args.currencies, elapsed / len(legacy_queries)))
+    for cache_size in (0, args.cache_size):
+        converter = synthetic_converter(rates, cache_size=cache_size)
+        elapsed, _ = timed(lambda: [converter.get_xchg(currency_from, 1, currency_to) for (currency_from, currency_to) in queries])
+        cache = converter.rate_cache
+        print('rates currencies=%d pairs=%d cache=%d: %.6fs/query, %d hits, %d misses' % (
+            args.currencies, args.pairs, cache_size, elapsed / len(queries), cache.hits, cache.misses))
+
+
+def legacy_roman_to_int(number_str):
+    number_str = number_str.upper()
+    nums = ['M', 'D', 'C', 'L', 'X', 'V', 'I']
+    ints = [1000, 500, 100, 50, 10, 5, 1]
+    places = []
+    for i in range(len(number_str)):
+        c = number_str[i]
+        value = ints[nums.index(c)]
+        # If the next place holds a larger number, this value is negative.
+        try:
+            if ints[nums.index(number_str[i + 1])] > value:
+                value *= -1
+        except IndexError:
+            # there is no next place.
+            pass
+        places.append(value)
+    return sum(places)
+
+
+def legacy_lookup_tokens(token_map, tokens):
+    # TokenMap.lookup_tokens following alias chains on every lookup
+    for token in tokens:
+        digit = None
+        while token in token_map.items:
+            mapping = token_map.items[token]
+            if mapping['type'] == 'roman_digit':
+                digit = mapping['value']
+                break
+            token = mapping['value']
+        if digit is None:
+            raise ValueError
+        yield digit
+
+
+def legacy_process_line(converter, line, output):
+    # Converter.process_line before the dispatch table, answers and warnings go to output
+    token_map = converter.token_map
+    xchg_graph = converter.xchg_graph
+
+    line = line.strip()
+    tokens = list(map(lambda token: token.strip(), line.split(' ')))
+    if len(tokens) < 3:
+        output.write('WARNING: too few tokens, line ignored. Line: %s\n' % line)
+        return
+    try:
+        is_index = tokens.index('is')
+    except ValueError:
+        output.write('WARNING: line has no "is" token, line ignored. Line: %s\n' % line)
+        return
+
+    if tokens[0] == 'how':
+        # query clause
+        if tokens[1] == 'much':
+            lvalue = tokens[2:is_index]
+            if lvalue:  # extra tokens between "how much" and "is"
+                output.write('WARNING: extra tokens between "how much" and "is", line ignored. Line: %s\n' % line)
+                return
+            if tokens[-1] != '?':
+                output.write('WARNING: no question mark in question, line ignored. Line: %s\n' % line)
+                return
+            rvalue = tokens[is_index + 1:-1]  # strip "?"
+            try:
+                roman_value = list(legacy_lookup_tokens(token_map, rvalue))
+            except ValueError:
+                output.write('WARNING: currency assignment left clause has unknown alias, line ignored. Line: %s\n' % line)
+                return
+            try:
+                numeric_value = legacy_roman_to_int(''.join(roman_value))
+            except ValueError:
+                output.write('WARNING: roman number conversion failed, line ignored. Line: %s\n' % line)
+                return
+            # response on "how much" question
+            output.write('%s is %d\n' % (' '.join(rvalue), numeric_value))
+        elif tokens[1] == 'many':
+            lvalue = tokens[2:is_index]
+            if len(lvalue) != 1:  # extra tokens between "how much" and "is"
+                output.write('WARNING: currency name should be exact one token, line ignored. Line: %s\n' % line)
+                return
+            currency_to = lvalue[0]
+            if tokens[-1] != '?':
+                output.write('WARNING: no question mark in question, line ignored. Line: %s\n' % line)
+                return
+            rvalue = tokens[is_index + 1:-1]  # strip "?"
+            if len(rvalue) < 2:
+                output.write('WARNING: right clause must have at least one digit and a currency token, line ignored. Line: %s\n' % line)
+                return
+            currency_from = rvalue[-1]
+            try:
+                numbers_from = list(legacy_lookup_tokens(token_map, rvalue[:-1]))
+            except ValueError:
+                output.write('WARNING: right clause has wrong roman aliased number, line ignored. Line: %s\n' % line)
+                return
+            try:
+                value_from = legacy_roman_to_int(''.join(numbers_from))
+            except ValueError:
+                output.write('WARNING: right clause has wrong roman aliased number, line ignored. Line: %s\n' % line)
+                return
+            # response on "how many" question
+            try:
+                output.write('%s is %f %s\n' % (' '.join(rvalue), converter.get_xchg(currency_from, value_from, currency_to), currency_to))
+            except KeyError:
+                output.write('WARNING: no exchange rates for the specied currency. Line: %s\n' % line)
+                return
+        else:
+            output.write('I have no idea what you are talking about\n')
+            return
+    else:
+        # assignment clause
+        lvalue = tokens[:is_index]
+        rvalue = tokens[is_index + 1:]
+        if not lvalue:
+            output.write('WARNING: line has wrong assignment, line ignored. Line: %s\n' % line)
+            return
+        if len(lvalue) == 1:
+            # alias assignment
+            if len(rvalue) == 1 and (rvalue[0] in ['I', 'V', 'X', 'L', 'C', 'D', 'M']):
+                token_map.add_digit(lvalue[0], rvalue[0])
+            elif len(rvalue) == 1:
+                token_map.add_alias(lvalue[0], rvalue[0])
+            else:
+                output.write('WARNING: mapping of alias to two tokens is not yet supported, line ignored. Line: %s\n' % line)
+                return
+        else:
+            # currency exchange assignment
+            if len(rvalue) != 2:
+                output.write('WARNING: currency assignment right clause must have value and currency, line ignored. Line: %s\n' % line)
+                return
+            try:
+                numbers_from = list(legacy_lookup_tokens(token_map, lvalue[:-1]))
+            except ValueError:
+                output.write('WARNING: currency assignment left clause has unknown alias, line ignored. Line: %s\n' % line)
+                return
+            try:
+                value_from = legacy_roman_to_int(''.join(numbers_from))
+            except ValueError:
+                output.write('WARNING: currency assignment left clause has wrong roman aliased number, line ignored. Line: %s\n' % line)
+                return
+            currency_from = lvalue[-1]
+            try:
+                value_to = int(rvalue[0])
+            except (TypeError, ValueError):
+                output.write('WARNING: currency assignment right clause must have decimal value, line ignored. Line: %s\n' % line)
+                return
+            currency_to = rvalue[1]
+            # currency exchange graph assignment
+            converter.add_xchg(currency_from, value_from, currency_to, value_to)
+
+
+def int_to_roman(value):
+    digits = [(1000, 'M'), (900, 'CM'), (500, 'D'), (400, 'CD'), (100, 'C'), (90, 'XC'),
+              (50, 'L'), (40, 'XL'), (10, 'X'), (9, 'IX'), (5, 'V'), (4, 'IV'), (1, 'I')]
+    roman = list()
+    for digit_value, digit in digits:
+        count, value = divmod(value, digit_value)
+        roman.append(digit * count)
+    return ''.join(roman)
+
+
+def synthetic_feed(line_count, currency_count=100, alias_depth=3, seed=0):
+    # Digit and alias definitions, consistent rates and questions in the task3 input format
+    rnd = random.Random(seed)
+    lines = list()
+    aliases = dict()
+    for digit in 'IVXLCDM':
+        token = 'tok%s0' % digit.lower()
+        lines.append('%s is %s' % (token, digit))
+        for depth in range(1, alias_depth + 1):
+            alias = 'tok%s%d' % (digit.lower(), depth)
+            lines.append('%s is %s' % (alias, token))
+            token = alias
+        aliases[digit] = token
+
+    def spell(value):
+        return ' '.join(aliases[digit] for digit in int_to_roman(value))
+
+    rates = synthetic_rates(currency_count, seed=seed)
+    for currency_from, value_from, currency_to, value_to in rates:
+        lines.append('%s %s is %d %s' % (spell(value_from), currency_from, value_to, currency_to))
+    currencies = sorted(set(rate[0] for rate in rates) | set(rate[2] for rate in rates))
+    while len(lines) < line_count:
+        if rnd.random() < 0.5:
+            lines.append('how much is %s ?' % spell(rnd.randint(1, 3999)))
+        else:
+            currency_from, currency_to = rnd.sample(currencies, 2)
+            lines.append('how many %s is %s %s ?' % (currency_to, spell(rnd.randint(1, 100)), currency_from))
+    return lines[:line_count]
+
+
+def bench_lines(args):
+    for size in args.sizes:
+        lines = synthetic_feed(size, args.currencies, seed=args.seed)
+        output_legacy = io.StringIO()
+        converter = task3.Converter()
+        elapsed_legacy, _ = timed(lambda: [legacy_process_line(converter, line, output_legacy) for line in lines])
+        output = io.StringIO()
+        converter = task3.Converter()
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = output
+        try:
+            elapsed, _ = timed(lambda: [converter.process_line(line) for line in lines])
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+        if output.getvalue() != output_legacy.getvalue():
+            raise AssertionError('Output differs')
+        print('lines=%d legacy process_line: %.0f lines/s' % (size, size / elapsed_legacy))
+        print('lines=%d process_line: %.0f lines/s' % (size, size / elapsed))
+
+
+def bench_roman(args):
+    rnd = random.Random(args.seed)
+    numerals = [int_to_roman(rnd.randint(1, 3999)) for _ in range(args.distinct)]
+    numbers = [rnd.choice(numerals) for _ in range(args.count)]
+    elapsed_legacy, expected = timed(lambda: [legacy_roman_to_int(number) for number in numbers])
+    task3.roman_to_int.cache_clear()
+    elapsed, values = timed(lambda: [task3.roman_to_int(number) for number in numbers])
+    task3.roman_to_int.cache_clear()
+    elapsed_batch, values_batch = timed(task3.roman_to_ints, numbers)
+    if not expected == values == values_batch:
+        raise AssertionError('Value mismatch')
+    invalid = ['IIII', 'VX', 'IC', 'MMMM', 'XIIX']
+    accepted = [number for number in invalid if legacy_roman_to_int(number) > 0]
+    print('roman numerals=%d distinct=%d legacy: %.0f/s, accepts %s' % (args.count, args.distinct, args.count / elapsed_legacy, ' '.join(accepted)))
+    print('roman numerals=%d distinct=%d roman_to_int: %.0f/s, %s' % (args.count, args.distinct, args.count / elapsed, task3.roman_to_int.cache_info()))
+    print('roman numerals=%d distinct=%d roman_to_ints: %.0f/s' % (args.count, args.distinct, args.count / elapsed_batch))
+
+
+def bench_revalue(args):
+    converter = synthetic_converter(synthetic_rates(args.currencies, seed=args.seed), cache_size=0)
+    currency_from = 'Cur0'
+    currencies = sorted(converter.currencies)
+    elapsed_single, values_single = timed(lambda: dict((currency, converter.get_xchg(currency_from, 100, currency)) for currency in currencies))
+    elapsed, values = timed(converter.convert_all, currency_from, 100)
+    if values != values_single:
+        raise AssertionError('Value mismatch')
+    elapsed_fixed, (names, fixed) = timed(converter.convert_all_fixed, currency_from, 100, 6)
+    print('revalue currencies=%d get_xchg per target: %.4fs' % (args.currencies, elapsed_single))
+    print('revalue currencies=%d convert_all: %.4fs' % (args.currencies, elapsed))
+    print('revalue currencies=%d convert_all_fixed: %.4fs' % (args.currencies, elapsed_fixed))
+
+
+def traced_peak(func, *args, **kwargs):
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_stream(args):
+    feed = ''.join('%s\n' % line for line in synthetic_feed(args.lines, args.currencies, seed=args.seed)).encode()
+    with open(os.devnull, 'w') as devnull:
+        processor = task3.StreamProcessor(task3.Converter(), devnull, devnull, args.chunk_size)
+        processor.run(io.BytesIO(feed))
+        stats = processor.stats()
+        print('stream lines=%d chunks=%d: %.0f lines/s, latency mean %.3fms, max %.3fms' % (
+            stats['lines'], stats['chunks'], stats['lines_per_second'], stats['latency_mean'] * 1000, stats['latency_max'] * 1000))
+
+        def read_all(feed):
+            converter = task3.Converter()
+            converter.output = converter.errors = devnull
+            for line in io.TextIOWrapper(io.BytesIO(feed)).readlines():
+                converter.process_line(line)
+
+        feed = feed[:feed.index(b'\n', len(feed) * args.memory_lines // args.lines) + 1]
+        peak_all = traced_peak(read_all, feed)
+        peak = traced_peak(task3.StreamProcessor(task3.Converter(), devnull, devnull, args.chunk_size).run, io.BytesIO(feed))
+        print('stream lines=%d readlines: peak %.1f MiB, %.1f MiB streaming' % (args.memory_lines, peak_all / 2.0 ** 20, peak / 2.0 ** 20))
+
+
+def bench_snapshot(args):
+    lines = [line for line in synthetic_feed(args.currencies * 2, args.currencies, seed=args.seed) if not line.startswith('how ')]
+    converter = task3.Converter()
+    elapsed_replay, _ = timed(lambda: [converter.process_line(line) for line in lines])
+    path = os.path.join(args.directory, 'converter.snapshot')
+    elapsed_save, _ = timed(converter.save, path)
+    elapsed_load, loaded = timed(task3.Converter.load, path)
+    rnd = random.Random(args.seed)
+    for _ in range(100):
+        currency_from, currency_to = rnd.sample(sorted(converter.currencies), 2)
+        if loaded.get_xchg(currency_from, 1, currency_to) != converter.get_xchg(currency_from, 1, currency_to):
+            raise AssertionError('Rate mismatch', currency_from, currency_to)
+    print('snapshot definitions=%d replay: %.3fs, save %.3fs, load %.3fs, %d bytes' % (
+        len(lines), elapsed_replay, elapsed_save, elapsed_load, os.path.getsize(path)))
+    os.remove(path)
+
+
+def bench_paths(args):
+    for size in args.sizes:
+        rates = synthetic_rates(size, extra_edges=size * args.degree, seed=args.seed)
+        rnd = random.Random(args.seed)
+        converter = synthetic_converter(rates)
+        currencies = sorted(converter.currencies)
+        queries = [tuple(rnd.sample(currencies, 2)) for _ in range(args.queries)]
+        elapsed_build, paths = timed(converter.get_exchange_paths)
+        settled = 0
+        elapsed = 0
+        for currency_from, currency_to in queries:
+            elapsed_query, (rate, path) = timed(paths.best_rate, currency_from, currency_to)
+            if rate != converter.get_rate(currency_from, currency_to):
+                raise AssertionError('Rate mismatch', currency_from, currency_to)
+            elapsed += elapsed_query
+            settled += paths.settled
+        print('paths currencies=%d quotes=%d: bellman-ford %.3fs, %.6fs/query, %.0f currencies settled/query' % (
+            size, len(rates), elapsed_build, elapsed / len(queries), settled / float(len(queries))))
+        # Quotes off the known rates by a random factor, each one opens arbitrage loops
+        for _ in range(args.arbitrage):
+            currency_from, currency_to = rnd.sample(currencies, 2)
+            try:
+                converter.add_xchg(currency_from, converter.get_rate(currency_from, currency_to) * rnd.choice([2, 3]), currency_to, 1)
+            except task3.ConverterException:
+                pass
+        elapsed_build, loops = timed(converter.arbitrage_loops)
+        if not all(gain > 1 for (_, gain) in loops):
+            raise AssertionError('Loop without gain')
+        print('paths currencies=%d conflicting quotes=%d: bellman-ford %.3fs, %d arbitrage loops' % (
+            size, len(converter.conflicts), elapsed_build, len(loops)))
+
+
+def suite_dijkstra(size, seed):
+    graph, names = synthetic_graph(size, seed=seed)
+    return lambda: graph.dijkstra(names[0]), size
+
+
+def suite_backtrack(stops, seed):
+    # Every walk of up to stops stops from one node of a degree 3 graph: 3 ** stops paths
+    graph, names = synthetic_graph(1000, degree=3, seed=seed)
+    return lambda: graph.backtrack(names[0], None, lambda context: False, lambda context: len(context['path']) >= stops), 3 ** stops
+
+
+def suite_scheduler(size, seed):
+    schedule_request = task2.ScheduleRequest(synthetic_talks(size, seed=seed))
+    return lambda: task2.Scheduler(schedule_request).solve(), size
+
+
+def suite_get_xchg(size, seed):
+    rnd = random.Random(seed)
+    converter = synthetic_converter(synthetic_rates(size, extra_edges=size // 10, seed=seed))
+    currencies = sorted(converter.currencies)
+    queries = [tuple(rnd.sample(currencies, 2)) for _ in range(10000)]
+    return lambda: [converter.get_xchg(currency_from, 1, currency_to) for (currency_from, currency_to) in queries], len(queries)
+
+
+def suite_process_line(size, seed):
+    lines = synthetic_feed(size, seed=seed)
+    converter = task3.Converter()
+    converter.output = converter.errors = io.StringIO()
+    return lambda: [converter.process_line(line) for line in lines], size
+
+
+# name -> (setup(size, seed) returning (run, work units), sizes in increasing scale)
+SUITE = [
+    ('task1.dijkstra', suite_dijkstra, (1000, 10000, 100000)),
+    ('task1.backtrack', suite_backtrack, (6, 8, 10)),
+    ('task2.scheduler', suite_scheduler, (100, 1000, 5000)),
+    ('task3.get_xchg', suite_get_xchg, (100, 1000, 10000)),
+    ('task3.process_line', suite_process_line, (1000, 10000, 100000)),
+]
+
+
+def bench_suite(args):
+    results = list()
+    for name, setup, sizes in SUITE:
+        if args.cases and name not in args.cases:
+            continue
+        for size in sizes[:args.levels]:
+            # Every run gets a fresh setup, the best time is kept; the peak is measured on one more run
+            elapsed = min(timed(setup(size, args.seed)[0])[0] for _ in range(args.repeat))
+            run, units = setup(size, args.seed)
+            peak = None if tracemalloc.is_tracing() else traced_peak(run)
+            results.append({'case': name, 'size': size, 'units': units, 'seconds': elapsed, 'peak_bytes': peak})
+            print('suite %s size=%d: %.4fs, %.2fus/unit, peak %s' % (
+                name, size, elapsed, elapsed * 1e6 / units, peak is None and 'n/a' or '%.1f MiB' % (peak / 2.0 ** 20)))
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    report = {'commit': commit, 'python': platform.python_version(), 'seed': args.seed, 'repeat': args.repeat, 'results': results}
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(report, json_file, indent=1)
+    if args.compare:
+        with open(args.compare) as json_file:
+            baseline = json.load(json_file)
+        baseline_results = dict(((result['case'], result['size']), result) for result in baseline['results'])
+        regressions = 0
+        for result in results:
+            before = baseline_results.get((result['case'], result['size']))
+            if before is None:
+                continue
+            ratio = result['seconds'] / before['seconds']
+            regressed = ratio > 1 + args.tolerance
+            regressions += regressed
+            print('compare %s size=%d: %.2fx time of %s%s' % (
+                result['case'], result['size'], ratio, baseline['commit'], regressed and ', REGRESSION' or ''))
+        if regressions:
+            sys.exit(1)
+
+
+def profiled(func, args):
+    # Hot spots of any benchmark run, written to stderr
+    if args.profile == 'cprofile':
+        profile = cProfile.Profile()
+        profile.runcall(func, args)
+        if args.profile_output:
+            profile.dump_stats(args.profile_output)
+        pstats.Stats(profile, stream=sys.stderr).sort_stats('cumulative').print_stats(args.profile_top)
+    else:
+        tracemalloc.start(args.profile_frames)
+        try:
+            func(args)
+            if not tracemalloc.is_tracing():
+                print('tracemalloc: tracing was stopped by the benchmark itself, no hot spots', file=sys.stderr)
+                return
+            peak = tracemalloc.get_traced_memory()[1]
+            snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        finally:
+            tracemalloc.stop()
+        print('tracemalloc: peak %.1f MiB, still allocated at the end of the run:' % (peak / 2.0 ** 20), file=sys.stderr)
+        for statistic in snapshot.statistics('traceback' if args.profile_frames > 1 else 'lineno')[:args.profile_top]:
+            print(statistic, file=sys.stderr)
+            if args.profile_frames > 1:
+                for line in statistic.traceback.format():
+                    print(line, file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Performance benchmarks')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--profile', choices=['cprofile', 'tracemalloc'], help='print the hot spots of the run to stderr')
+    parser.add_argument('--profile-top', type=int, default=20, help='functions or allocation sites listed')
+    parser.add_argument('--profile-frames', type=int, default=1, help='tracemalloc frames kept per allocation')
+    parser.add_argument('--profile-output', help='cProfile stats file, for pstats or snakeviz')
+    subparsers = parser.add_subparsers(dest='benchmark')
+    subparsers.required = True
+
+    parser_dijkstra = subparsers.add_parser('dijkstra', help='task1 shortest path search')
+    parser_dijkstra.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser_dijkstra.add_argument('--queries', type=int, default=1000)
+    parser_dijkstra.add_argument('--sources', type=int, default=10)
+    parser_dijkstra.add_argument('--legacy-max-nodes', type=int, default=10000)
+    parser_dijkstra.set_defaults(func=bench_dijkstra)
+
+    parser_compact = subparsers.add_parser('compact', help='task1 Graph against CompactGraph (CSR)')
+    parser_compact.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser_compact.add_argument('--degree', type=int, default=4)
+    parser_compact.add_argument('--walk', type=int, default=100000)
+    parser_compact.set_defaults(func=bench_compact)
+
+    parser_index = subparsers.add_parser('index', help='task1 all pairs DistanceIndex')
+    parser_index.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 2000])
+    parser_index.add_argument('--queries', type=int, default=1000)
+    parser_index.add_argument('--path', default='/tmp/task1.index')
+    parser_index.set_defaults(func=bench_index)
+
+    parser_dynamic = subparsers.add_parser('dynamic', help='task1 DynamicShortestPaths updates')
+    parser_dynamic.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser_dynamic.add_argument('--sources', type=int, default=5)
+    parser_dynamic.add_argument('--updates', type=int, default=1000)
+    parser_dynamic.set_defaults(func=bench_dynamic)
+
+    parser_queries = subparsers.add_parser('queries', help='task1 batch queries over a process pool')
+    parser_queries.add_argument('--size', type=int, default=10000)
+    parser_queries.add_argument('--queries', type=int, default=2000)
+    parser_queries.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser_queries.set_defaults(func=bench_queries)
+
+    parser_load = subparsers.add_parser('load', help='task1 edge list loaders, time and peak RSS')
+    parser_load.add_argument('--edges', type=int, default=1000000)
+    parser_load.add_argument('--directory', default='/tmp')
+    parser_load.set_defaults(func=bench_load)
+
+    parser_route = subparsers.add_parser('route', help='task1 point to point strategies on grid graphs')
+    parser_route.add_argument('--widths', type=int, nargs='+', default=[30, 100, 300])
+    parser_route.add_argument('--queries', type=int, default=100)
+    parser_route.add_argument('--landmarks', type=int, default=8)
+    parser_route.set_defaults(func=bench_route)
+
+    parser_parse = subparsers.add_parser('parse', help='task2 ScheduleRequest parsing')
+    parser_parse.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser_parse.set_defaults(func=bench_parse)
+    parser_schedule = subparsers.add_parser('schedule', help='task2 Scheduler search')
+    parser_schedule.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000])
+    parser_schedule.add_argument('--durations', default='5,30,45,60', help='comma separated talk durations, 5 is lightning')
+    parser_schedule.add_argument('--unschedulable', nargs='*', default=['50,70', '7,14,21', '185,200,30'],
+                                 help='durations that cannot be scheduled, rejected before the search')
+    parser_schedule.set_defaults(func=bench_schedule)
+    parser_reschedule = subparsers.add_parser('reschedule', help='task2 incremental updates against a full solve')
+    parser_reschedule.add_argument('--size', type=int, default=2000)
+    parser_reschedule.add_argument('--updates', type=int, default=200, help='talks added or withdrawn, half each')
+    parser_reschedule.add_argument('--durations', default='5,30,45,60', help='comma separated talk durations, 5 is lightning')
+    parser_reschedule.set_defaults(func=bench_reschedule)
+    parser_portfolio = subparsers.add_parser('portfolio', help='task2 time to first schedule by worker count')
+    parser_portfolio.add_argument('--size', type=int, default=200)
+    parser_portfolio.add_argument('--durations', default=','.join(map(str, range(5, 171))), help='comma separated talk durations')
+    parser_portfolio.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser_portfolio.add_argument('--budget', type=float, default=30)
+    parser_portfolio.set_defaults(func=bench_portfolio)
+    parser_rates = subparsers.add_parser('rates', help='task3 Converter.get_xchg against the graph traversal, with and without the rate cache')
+    parser_rates.add_argument('--currencies', type=int, default=200)
+    parser_rates.add_argument('--pairs', type=int, default=300, help='distinct currency pairs asked')
+    parser_rates.add_argument('--queries', type=int, default=2000)
+    parser_rates.add_argument('--cache-size', type=int, default=1024)
+    parser_rates.add_argument('--legacy-queries', type=int, default=50, help='queries timed with the ConverterProcessed traversal')
+    parser_rates.set_defaults(func=bench_rates)
+    parser_lines = subparsers.add_parser('lines', help='task3 Converter.process_line against the if/elif version')
+    parser_lines.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser_lines.add_argument('--currencies', type=int, default=100)
+    parser_lines.set_defaults(func=bench_lines)
+    parser_roman = subparsers.add_parser('roman', help='task3 roman numeral decoding')
+    parser_roman.add_argument('--count', type=int, default=1000000)
+    parser_roman.add_argument('--distinct', type=int, default=200)
+    parser_roman.set_defaults(func=bench_roman)
+    parser_revalue = subparsers.add_parser('revalue', help='task3 one amount in every currency')
+    parser_revalue.add_argument('--currencies', type=int, default=10000)
+    parser_revalue.set_defaults(func=bench_revalue)
+    parser_stream = subparsers.add_parser('stream', help='task3 StreamProcessor on a synthetic feed')
+    parser_stream.add_argument('--lines', type=int, default=1000000)
+    parser_stream.add_argument('--memory-lines', type=int, default=100000, help='lines of the feed replayed under tracemalloc')
+    parser_stream.add_argument('--currencies', type=int, default=100)
+    parser_stream.add_argument('--chunk-size', type=int, default=1 << 16)
+    parser_stream.set_defaults(func=bench_stream)
+    parser_snapshot = subparsers.add_parser('snapshot', help='task3 Converter snapshot against replaying definitions')
+    parser_snapshot.add_argument('--currencies', type=int, default=100000)
+    parser_snapshot.add_argument('--directory', default='/tmp')
+    parser_snapshot.set_defaults(func=bench_snapshot)
+    parser_paths = subparsers.add_parser('paths', help='task3 best rate paths and arbitrage loops on dense quote graphs')
+    parser_paths.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000])
+    parser_paths.add_argument('--degree', type=int, default=10, help='quotes per currency beyond the spanning tree')
+    parser_paths.add_argument('--queries', type=int, default=200)
+    parser_paths.add_argument('--arbitrage', type=int, default=5, help='conflicting quotes added afterwards')
+    parser_paths.set_defaults(func=bench_paths)
+    parser_suite = subparsers.add_parser('suite', help='hot paths of all three tools at increasing scale, time and peak memory')
+    parser_suite.add_argument('--cases', nargs='*', choices=[name for (name, _, _) in SUITE], help='all cases by default')
+    parser_suite.add_argument('--levels', type=int, default=3, help='number of scales run per case')
+    parser_suite.add_argument('--repeat', type=int, default=3)
+    parser_suite.add_argument('--json', help='write the results to this file')
+    parser_suite.add_argument('--compare', help='results file of an earlier run; exit status 1 on a regression')
+    parser_suite.add_argument('--tolerance', type=float, default=0.2, help='slowdown accepted by --compare')
+    parser_suite.set_defaults(func=bench_suite)
+
+    args = parser.parse_args()
+    if args.profile:
+        profiled(args.func, args)
+    else:
+        args.func(args)
+
+
+if __name__ == '__main__':
+    main()
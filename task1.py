@@ -2,27 +2,435 @@
 
 
 import sys
-import re
+import argparse
+import multiprocessing
+import concurrent.futures
 import operator
 import itertools
 import functools
 import heapq
-import copy
+import bisect
+import array
 import math
+import struct
+import hashlib
+import mmap
+import time
 
 
-class Graph(object):
+def parse_vertex(vertex):
+    # Same as ^(\w)(\w)(\d+)$ without a regex match per edge
+    if len(vertex) < 3 or not (vertex[0].isalnum() or vertex[0] == '_') or not (vertex[1].isalnum() or vertex[1] == '_'):
+        raise AssertionError('Unexpected input', vertex)
+    distance = vertex[2:]
+    if not distance.isdecimal():
+        raise AssertionError('Unexpected input', vertex)
+    return vertex[0], vertex[1], int(distance)
+
+
+def parse_vertices(str_value):
+    for vertex in str_value.split(','):
+        yield parse_vertex(vertex.strip())
+
+
+def iter_records(stream, separator, chunk_size=1 << 20):
+    tail = ''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        records = (tail + chunk).split(separator)
+        tail = records.pop()
+        for record in records:
+            yield record
+    yield tail
+
+
+def iter_edges(stream, edge_format='compact', chunk_size=1 << 20):
+    # compact: "AB5, BC4" with single character nodes; csv/tsv: "from,to,distance" rows
+    if edge_format == 'compact':
+        for vertex in iter_records(stream, ',', chunk_size):
+            vertex = vertex.strip()
+            if vertex:
+                yield parse_vertex(vertex)
+    elif edge_format in ('csv', 'tsv'):
+        separator = edge_format == 'csv' and ',' or '\t'
+        for row in iter_records(stream, '\n', chunk_size):
+            if not row.strip():
+                continue
+            fields = row.split(separator)
+            if len(fields) != 3:
+                raise AssertionError('Unexpected input', row)
+            # Digits only, as in the compact format: no sign, no underscores
+            distance = fields[2].strip()
+            if not distance.isdecimal():
+                raise GraphException('Distance value is not expected', row)
+            yield fields[0].strip(), fields[1].strip(), int(distance)
+    else:
+        raise AssertionError('Unexpected edge format', edge_format)
+
+
+def load_graph(path=None, edge_format='compact', chunk_size=1 << 20):
+    if edge_format == 'binary':
+        return CompactGraph.load(path)
+    if path is None:
+        return CompactGraph.from_edges(iter_edges(sys.stdin, edge_format, chunk_size))
+    with open(path) as graph_file:
+        return CompactGraph.from_edges(iter_edges(graph_file, edge_format, chunk_size))
+
+
+def pack_names(names):
+    names = [name.encode('utf-8') for name in names]
+    return array.array('I', map(len, names)).tobytes() + b''.join(names)
+
+
+def unpack_names(buffer, position, count):
+    name_lengths = array.array('I')
+    name_lengths.frombytes(buffer[position:position + 4 * count])
+    position += 4 * count
+    names = list()
+    for name_length in name_lengths:
+        names.append(str(buffer[position:position + name_length], 'utf-8'))
+        position += name_length
+    return names, position
+
+
+class GraphBase(object):
+    # Algorithms below work on node keys through node_key/node_name/adjacent,
+    # so they run both on the mutable Graph and on the frozen CompactGraph
+
+    def node_key(self, node):
+        raise NotImplementedError
+
+    def node_name(self, key):
+        raise NotImplementedError
+
+    def has_node(self, node):
+        raise NotImplementedError
+
+    def node_keys(self):
+        raise NotImplementedError
+
+    def adjacent(self, key):
+        raise NotImplementedError
+
+    def distance_immediate(self, node1, node2):
+        raise NotImplementedError
+
+    def distance_nodes(self, nodes):
+        if len(nodes) < 2:
+            raise GraphException('Path must have at least two nodes')
+        return functools.reduce(operator.add, map(lambda node_pair: self.distance_immediate(node_pair[0], node_pair[1]), zip(nodes[:-1], nodes[1:])), 0)
+
+    def backtrack(self, start_node, end_node, match_predicate, terminate_predicate, context=None):
+        return list(self.iter_paths(start_node, end_node, match_predicate, terminate_predicate, context=context))
+
+    def iter_paths(self, start_node, end_node, match_predicate, terminate_predicate, prune_predicate=None, limit=None, context=None):
+        # Predicates and results see node names in context['path'], see iter_key_paths
+        return self.iter_key_paths(start_node, end_node, match_predicate, terminate_predicate, prune_predicate, limit, context)
+
+    def iter_key_paths(self, start_key, end_key, match_predicate, terminate_predicate, prune_predicate=None, limit=None, context=None,
+                       names=None):
+        # Depth first in the order of the recursive backtrack, with an explicit stack.
+        # prune_predicate(context) cuts the context with everything below it,
+        # the caller may tighten it between yields (branch and bound).
+        # context['path'] holds node keys, or names[key] when names is given
+        found = 0
+        stack = [(start_key, context or dict(path=[], distance=0))]
+        while stack:
+            key, context = stack.pop()
+            if prune_predicate is not None and prune_predicate(context):
+                continue
+            if match_predicate(context) and key == end_key:
+                yield {'path': context['path'], 'distance': context.get('distance')}
+                found += 1
+                if limit is not None and found >= limit:
+                    return
+            if terminate_predicate(context):
+                continue
+            path, distance = context['path'], context['distance']
+            if names is None:
+                children = [(key_adj, {'path': path + [key_adj], 'distance': distance + edge_distance})
+                            for (key_adj, edge_distance) in self.adjacent(key)]
+            else:
+                children = [(key_adj, {'path': path + [names[key_adj]], 'distance': distance + edge_distance})
+                            for (key_adj, edge_distance) in self.adjacent(key)]
+            children.reverse()
+            stack.extend(children)
+
+    def shortest_loop(self, node, max_stops):
+        # Shortest simple loop through node, branch and bound on the distance so far
+        # plus the shortest edge leading back into node
+        if not self.has_node(node):
+            return None
+        key = self.node_key(node)
+        return_distances = [distance for node_from in self.node_keys() for (node_to, distance) in self.adjacent(node_from) if node_to == key]
+        if not return_distances:
+            return None
+        return_distance = min(return_distances)
+        best = dict(distance=math.inf, loop=None)
+
+        def match_predicate(context):
+            path = context['path']
+            return len(path) > 0 and len(set(path)) == len(path)
+
+        def prune_predicate(context):
+            path = context['path']
+            if len(set(path)) != len(path):
+                return True
+            lower_bound = context['distance'] + (0 if path and path[-1] == key else return_distance)
+            return lower_bound >= best['distance']
+
+        for loop in self.iter_key_paths(key, key, match_predicate, lambda context: len(context['path']) >= max_stops, prune_predicate):
+            best['distance'] = loop['distance']
+            best['loop'] = loop
+        if best['loop'] is None:
+            return None
+        return {'path': [self.node_name(key_path) for key_path in best['loop']['path']], 'distance': best['distance']}
+
+    def count_walks(self, node_from, node_to, min_stops, max_stops):
+        # Walks with min_stops..max_stops stops, one vector of walk counts per stop
+        try:
+            key_from = self.node_key(node_from)
+            key_to = self.node_key(node_to)
+        except KeyError:
+            return 0
+        total = 0
+        counts = {key_from: 1}
+        for stops in range(max_stops + 1):
+            if stops >= min_stops:
+                total += counts.get(key_to, 0)
+            if stops == max_stops or not counts:
+                break
+            counts_next = dict()
+            for key, count in counts.items():
+                for key_adj, _ in self.adjacent(key):
+                    counts_next[key_adj] = counts_next.get(key_adj, 0) + count
+            counts = counts_next
+        return total
+
+    def count_walks_within(self, node_from, node_to, max_distance):
+        # Walks of distance 0 < d < max_distance, counted over (distance, node) states; a
+        # distance level is dropped as soon as it has been expanded. Zero distance edges
+        # stay within their level, a zero distance cycle makes the count of everything it
+        # reaches infinite: GraphException when that reaches node_to
+        try:
+            key_from = self.node_key(node_from)
+            key_to = self.node_key(node_to)
+        except KeyError:
+            return 0
+        total = 0
+        zero_cyclic = None
+        levels = {0: {key_from: 1}}
+        distances = [0]
+        while distances:
+            distance = heapq.heappop(distances)
+            counts = levels.pop(distance)
+            level = dict()
+            while counts:
+                counts_zero = dict()
+                for key, count in counts.items():
+                    known = level.get(key, 0)
+                    if known == math.inf:
+                        continue
+                    for key_adj, edge_distance in self.adjacent(key):
+                        if edge_distance == 0:
+                            if zero_cyclic is None:
+                                zero_cyclic = self.zero_cyclic_keys()
+                            if key in zero_cyclic:
+                                count = math.inf
+                            counts_zero[key_adj] = counts_zero.get(key_adj, 0) + count
+                    level[key] = known + count
+                counts = counts_zero
+            if distance > 0:
+                total += level.get(key_to, 0)
+            for key, count in level.items():
+                for key_adj, edge_distance in self.adjacent(key):
+                    if edge_distance < 0:
+                        raise GraphException('Walk count is unbounded with negative distance edges')
+                    new_distance = distance + edge_distance
+                    if edge_distance == 0 or new_distance >= max_distance:
+                        continue
+                    counts_next = levels.get(new_distance)
+                    if counts_next is None:
+                        counts_next = levels[new_distance] = dict()
+                        heapq.heappush(distances, new_distance)
+                    counts_next[key_adj] = counts_next.get(key_adj, 0) + count
+        if total == math.inf:
+            raise GraphException('Walk count is unbounded with a zero distance cycle')
+        return total
+
+    def zero_cyclic_keys(self):
+        # Nodes on a cycle of zero distance edges: strongly connected components of the
+        # zero distance edges with more than one node or a zero distance loop (Tarjan, iterative)
+        index = dict()
+        low = dict()
+        stack = list()
+        on_stack = set()
+        cyclic = set()
+        for root in self.node_keys():
+            if root in index:
+                continue
+            work = [(root, iter([key_adj for (key_adj, edge_distance) in self.adjacent(root) if edge_distance == 0]))]
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                key, children = work[-1]
+                for key_adj in children:
+                    if key_adj not in index:
+                        index[key_adj] = low[key_adj] = len(index)
+                        stack.append(key_adj)
+                        on_stack.add(key_adj)
+                        work.append((key_adj, iter([key_next for (key_next, edge_distance) in self.adjacent(key_adj) if edge_distance == 0])))
+                        break
+                    if key_adj in on_stack:
+                        low[key] = min(low[key], index[key_adj])
+                        if key_adj == key:
+                            cyclic.add(key)
+                else:
+                    work.pop()
+                    if work:
+                        low[work[-1][0]] = min(low[work[-1][0]], low[key])
+                    if low[key] == index[key]:
+                        component = list()
+                        while True:
+                            key_component = stack.pop()
+                            on_stack.discard(key_component)
+                            component.append(key_component)
+                            if key_component == key:
+                                break
+                        if len(component) > 1:
+                            cyclic.update(component)
+        return cyclic
+
+    def checksum(self):
+        digest = hashlib.sha256()
+        edges = sorted(
+            (self.node_name(key), self.node_name(key_adj), distance)
+            for key in self.node_keys()
+            for (key_adj, distance) in self.adjacent(key))
+        for edge in edges:
+            digest.update(('%s\t%s\t%d\n' % edge).encode('utf-8'))
+        return digest.digest()
+
+    def reversed(self):
+        raise NotImplementedError
+
+    def dijkstra(self, node_from):
+        return self.search(node_from).run()
+
+    def shortest_route(self, node_from, node_to, strategy='dijkstra', coordinates=None, landmarks=None):
+        # Point to point route as {'path', 'distance', 'settled'}, path is None without a route.
+        # astar uses landmarks (ALT) when given, else the straight line distance between
+        # coordinates[node] = (x, y), which must not exceed the edge distances
+        if not self.has_node(node_to):
+            raise KeyError(node_to)
+        if strategy == 'dijkstra':
+            search = self.search(node_from)
+        elif strategy == 'astar':
+            if landmarks is not None:
+                heuristic = landmarks.heuristic(node_to)
+            elif coordinates is not None:
+                heuristic = self.coordinates_heuristic(coordinates, node_to)
+            else:
+                heuristic = lambda key: 0
+            search = AStarSearch(self, node_from, heuristic)
+        elif strategy == 'bidirectional':
+            return self.bidirectional_route(node_from, node_to)
+        else:
+            raise GraphException('Unknown strategy', strategy)
+        key_to = self.node_key(node_to)
+        distance = search.run(key_to).get_key_distance(key_to)
+        path = None
+        if not math.isinf(distance):
+            path = [self.node_name(key) for key in search.get_key_path(key_to)]
+        return {'path': path, 'distance': distance, 'settled': search.get_settled_count()}
+
+    def coordinates_heuristic(self, coordinates, node_to):
+        # Every node needs coordinates, a zero estimate for some would not be consistent
+        missing = [self.node_name(key) for key in self.node_keys() if self.node_name(key) not in coordinates]
+        if missing:
+            raise GraphException('Nodes without coordinates', len(missing), missing[:10])
+        x_to, y_to = coordinates[node_to]
+        points = {self.node_key(node): point for (node, point) in coordinates.items() if self.has_node(node)}
+
+        def estimate(key):
+            x, y = points[key]
+            return math.hypot(x - x_to, y - y_to)
+        return estimate
+
+    def bidirectional_route(self, node_from, node_to):
+        # Forward search on the graph and backward search on the reversed graph, the smaller
+        # queue moves first; done once the queue tops together reach the best meeting distance
+        forward = self.search(node_from)
+        if forward.key_from == self.node_key(node_to):
+            return {'path': [node_from], 'distance': 0, 'settled': 0}
+        backward = self.reversed().search(node_to)
+        best = math.inf
+        meeting = None
+        while forward.queue and backward.queue and forward.queue[0][0] + backward.queue[0][0] < best:
+            if len(forward.queue) <= len(backward.queue):
+                search, search_other, graph = forward, backward, self
+            else:
+                search, search_other, graph = backward, forward, backward.graph
+            key = search.step()
+            if key is None:
+                continue
+            distance = search.get_key_distance(key)
+            for key_adj, edge_distance in graph.adjacent(key):
+                total = distance + edge_distance + search_other.get_key_distance(key_adj)
+                if total < best:
+                    best = total
+                    meeting = (key, key_adj) if search is forward else (key_adj, key)
+        settled = forward.get_settled_count() + backward.get_settled_count()
+        if meeting is None:
+            return {'path': None, 'distance': math.inf, 'settled': settled}
+        path = forward.get_key_path(meeting[0]) + list(reversed(backward.get_key_path(meeting[1])))
+        return {'path': [self.node_name(key) for key in path], 'distance': best, 'settled': settled}
+
+    def search(self, node_from):
+        return DijkstraSearch(self, node_from)
+
+    def shortest_distance(self, node_from, node_to):
+        return self.search(node_from).get_node_distance(node_to)
+
+    def shortest_distances(self, node_pairs):
+        # Queries from the same source share one resumable search
+        searches = dict()
+        results = list()
+        for node_from, node_to in node_pairs:
+            try:
+                search = searches.get(node_from)
+                if search is None:
+                    search = searches[node_from] = self.search(node_from)
+                results.append(search.get_node_distance(node_to))
+            except KeyError:
+                results.append(math.inf)
+        return results
+
+
+class Graph(GraphBase):
     def __init__(self, nodes=None, vertex_map=None):
         self.nodes = nodes or dict()
         self.vertex_map = vertex_map or dict()
+        self.graph_reversed = None
 
     def add_vertex(self, node_from, node_to, options):
+        self.graph_reversed = None
         self.nodes.setdefault(node_from, dict())
         self.nodes.setdefault(node_to, dict())
         vertex_options = self.vertex_map.setdefault(node_from, dict()).setdefault(node_to, dict())
         for option_key, option_value in options.items():
             vertex_options[option_key] = option_value
 
+    def remove_vertex(self, node_from, node_to):
+        self.graph_reversed = None
+        try:
+            del self.vertex_map[node_from][node_to]
+        except KeyError:
+            raise GraphException('No such vertex', node_from, node_to)
+
     def set_node_distance(self, node, distance):
         self.nodes.setdefault(node, dict())['distance'] = distance
 
@@ -40,157 +448,778 @@ class Graph(object):
 
     @classmethod
     def from_str(cls, str_value):
-        re_vertex = re.compile('^(\\w)(\\w)(\\d+)$')
         graph = cls()
-        for vertex in [item.strip() for item in str_value.split(',')]:
-            re_vertex_match = re_vertex.match(vertex)
-            if re_vertex_match is None:
-                raise AssertionError('Unexpected input', vertex)
-            node_from = re_vertex_match.group(1)
-            node_to = re_vertex_match.group(2)
-            distance = re_vertex_match.group(3)
-            try:
-                distance = int(distance)
-            except (TypeError, ValueError):
-                raise AssertionError('Distance value is not expected')
+        for node_from, node_to, distance in parse_vertices(str_value):
             graph.add_vertex(node_from, node_to, {'distance': distance})
         return graph
 
+    def freeze(self):
+        return CompactGraph.from_graph(self)
+
+    def reversed(self):
+        # Cached until the next add_vertex or remove_vertex
+        if self.graph_reversed is None:
+            graph = type(self)()
+            for node_from, adjanced in self.vertex_map.items():
+                for node_to, options in adjanced.items():
+                    graph.add_vertex(node_to, node_from, options)
+            self.graph_reversed = graph
+        return self.graph_reversed
+
+    def node_key(self, node):
+        return node
+
+    def node_name(self, key):
+        return key
+
+    def has_node(self, node):
+        return node in self.nodes
+
+    def node_keys(self):
+        return self.vertex_map.keys()
+
+    def adjacent(self, node):
+        return ((node_adj, options['distance']) for (node_adj, options) in self.vertex_map.get(node, {}).items())
+
     def distance_immediate(self, node1, node2):
         try:
             return self.vertex_map[node1][node2]['distance']
         except KeyError:
             raise GraphException()
 
+
+class CompactGraph(GraphBase):
+    # Frozen compressed sparse row form: edges of node i are
+    # targets[offsets[i]:offsets[i + 1]] (sorted) with matching weights.
+    # Binary file layout: header, name lengths (uint32), names (utf-8), padding to 8 bytes,
+    # offsets (int64), weights (int64), targets (int32); arrays are memory mapped on load
+    MAGIC = b'T1CG'
+    VERSION = 1
+    HEADER = struct.Struct('<4sIBxxxQQQ')
+
+    def __init__(self, names, offsets, targets, weights, ids=None, mapping=None):
+        self.names = names
+        self.ids = ids if ids is not None else {name: node_id for node_id, name in enumerate(names)}
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        # File mapped by load, held until close
+        self.mapping = mapping
+        self.graph_reversed = None
+
+    @classmethod
+    def from_edges(cls, edges):
+        ids = dict()
+        names = list()
+        edge_sources = array.array('i')
+        edge_targets = array.array('i')
+        edge_weights = array.array('q')
+        for node_from, node_to, distance in edges:
+            for node in (node_from, node_to):
+                if node not in ids:
+                    ids[node] = len(names)
+                    names.append(node)
+            edge_sources.append(ids[node_from])
+            edge_targets.append(ids[node_to])
+            edge_weights.append(distance)
+
+        node_count = len(names)
+        offsets = array.array('q', bytes(8 * (node_count + 1)))
+        for source in edge_sources:
+            offsets[source + 1] += 1
+        for node_id in range(node_count):
+            offsets[node_id + 1] += offsets[node_id]
+
+        # Counting sort by source keeps the input order within a row
+        positions = offsets[:-1]
+        targets = array.array('i', bytes(4 * len(edge_sources)))
+        weights = array.array('q', bytes(8 * len(edge_sources)))
+        for source, target, weight in zip(edge_sources, edge_targets, edge_weights):
+            position = positions[source]
+            targets[position] = target
+            weights[position] = weight
+            positions[source] = position + 1
+        del positions, edge_sources, edge_targets, edge_weights
+
+        # Sort every row by target; of duplicate edges the last one wins, as with Graph.add_vertex
+        position = 0
+        start = 0
+        for node_id in range(node_count):
+            end = offsets[node_id + 1]
+            row = sorted(zip(targets[start:end], range(start, end)))
+            row_weights = weights[start:end]
+            offsets[node_id] = position
+            for index, (target, edge) in enumerate(row):
+                if index + 1 < len(row) and row[index + 1][0] == target:
+                    continue
+                targets[position] = target
+                weights[position] = row_weights[edge - start]
+                position += 1
+            start = end
+        offsets[node_count] = position
+        del targets[position:]
+        del weights[position:]
+        return cls(names, offsets, targets, weights)
+
+    @classmethod
+    def from_graph(cls, graph):
+        return cls.from_edges(
+            (node_from, node_to, options['distance'])
+            for (node_from, adjanced) in graph.vertex_map.items()
+            for (node_to, options) in adjanced.items())
+
+    @classmethod
+    def from_str(cls, str_value):
+        return cls.from_edges(parse_vertices(str_value))
+
+    def save(self, path):
+        names = pack_names(self.names)
+        with open(path, 'wb') as graph_file:
+            graph_file.write(self.HEADER.pack(self.MAGIC, self.VERSION, sys.byteorder == 'little', len(self.names), len(self.targets), len(names) - 4 * len(self.names)))
+            graph_file.write(names)
+            graph_file.write(bytes(-graph_file.tell() % 8))
+            graph_file.write(bytes(self.offsets))
+            graph_file.write(bytes(self.weights))
+            graph_file.write(bytes(self.targets))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as graph_file:
+            mapping = mmap.mmap(graph_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, little_endian, node_count, edge_count, names_size = cls.HEADER.unpack_from(mapping, 0)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            mapping.close()
+            raise GraphException('Unsupported graph file', path)
+        if bool(little_endian) != (sys.byteorder == 'little'):
+            mapping.close()
+            raise GraphException('Graph file byte order does not match this machine', path)
+        names, position = unpack_names(mapping, cls.HEADER.size, node_count)
+        position += -position % 8
+        view = memoryview(mapping)
+        offsets = view[position:position + 8 * (node_count + 1)].cast('q')
+        position += 8 * (node_count + 1)
+        weights = view[position:position + 8 * edge_count].cast('q')
+        position += 8 * edge_count
+        targets = view[position:position + 4 * edge_count].cast('i')
+        view.release()
+        return cls(names, offsets, targets, weights, mapping=mapping)
+
+    def close(self):
+        # Unmaps a loaded graph, its arrays cannot be used afterwards
+        if self.mapping is not None:
+            self.offsets.release()
+            self.weights.release()
+            self.targets.release()
+            self.mapping.close()
+            self.mapping = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __reduce__(self):
+        # Pickled with copies of the arrays, memoryviews of a loaded graph cannot be pickled
+        return (type(self), (self.names,
+                             array.array('q', bytes(self.offsets)),
+                             array.array('i', bytes(self.targets)),
+                             array.array('q', bytes(self.weights))))
+
+    def reversed(self):
+        # Cached, the graph is frozen; node ids are shared with this graph
+        if self.graph_reversed is None:
+            node_count = len(self.names)
+            offsets = array.array('q', bytes(8 * (node_count + 1)))
+            for target in self.targets:
+                offsets[target + 1] += 1
+            for node_id in range(node_count):
+                offsets[node_id + 1] += offsets[node_id]
+            positions = offsets[:-1]
+            targets = array.array('i', bytes(4 * len(self.targets)))
+            weights = array.array('q', bytes(8 * len(self.targets)))
+            for source in range(node_count):
+                for edge in range(self.offsets[source], self.offsets[source + 1]):
+                    position = positions[self.targets[edge]]
+                    targets[position] = source
+                    weights[position] = self.weights[edge]
+                    positions[self.targets[edge]] = position + 1
+            self.graph_reversed = type(self)(self.names, offsets, targets, weights, self.ids)
+            self.graph_reversed.graph_reversed = self
+        return self.graph_reversed
+
+    def node_key(self, node):
+        return self.ids[node]
+
+    def node_name(self, key):
+        return self.names[key]
+
+    def has_node(self, node):
+        return node in self.ids
+
+    def node_keys(self):
+        return range(len(self.names))
+
+    def adjacent(self, key):
+        start = self.offsets[key]
+        end = self.offsets[key + 1]
+        return zip(self.targets[start:end], self.weights[start:end])
+
+    def distance_immediate(self, node1, node2):
+        try:
+            key1 = self.ids[node1]
+            key2 = self.ids[node2]
+        except KeyError:
+            raise GraphException()
+        end = self.offsets[key1 + 1]
+        position = bisect.bisect_left(self.targets, key2, self.offsets[key1], end)
+        if position == end or self.targets[position] != key2:
+            raise GraphException()
+        return self.weights[position]
+
     def distance_nodes(self, nodes):
+        # One id lookup per node and a binary search in the row of each hop
         if len(nodes) < 2:
             raise GraphException('Path must have at least two nodes')
-        return functools.reduce(operator.add, map(lambda node_pair: self.distance_immediate(node_pair[0], node_pair[1]), zip(nodes[:-1], nodes[1:])), 0)
+        try:
+            keys = [self.ids[node] for node in nodes]
+        except KeyError:
+            raise GraphException()
+        offsets, targets, weights = self.offsets, self.targets, self.weights
+        bisect_left = bisect.bisect_left
+        total = 0
+        for key_from, key_to in zip(keys, keys[1:]):
+            end = offsets[key_from + 1]
+            position = bisect_left(targets, key_to, offsets[key_from], end)
+            if position == end or targets[position] != key_to:
+                raise GraphException()
+            total += weights[position]
+        return total
 
-    def backtrack(self, start_node, end_node, match_predicate, terminate_predicate, context=None):
-        results = list()
-        context = context or dict(path=[], distance=0)
-        if match_predicate(context) and start_node == end_node:
-            results.append({'path': context['path'], 'distance': context.get('distance')})
-        if terminate_predicate(context):
-            return results
-        adjanced_nodes = self.vertex_map.get(start_node, {}).keys()
-        for adjanced_node in adjanced_nodes:
-            results += self.backtrack(adjanced_node, end_node, match_predicate, terminate_predicate, {
-                'path': context['path'] + [adjanced_node],
-                'distance': context['distance'] + self.vertex_map[start_node][adjanced_node]['distance'],
-            })
-        return results
+    def search(self, node_from):
+        return CompactDijkstraSearch(self, node_from)
 
-    def dijkstra(self, node_from):
-        graph = type(self)(copy.deepcopy(self.nodes), copy.deepcopy(self.vertex_map))
-        # Set the distance for the start node to zero 
-        graph.set_node_distance(node_from, 0)
+    def iter_paths(self, start_node, end_node, match_predicate, terminate_predicate, prune_predicate=None, limit=None, context=None):
+        # Node names in context['path'] as on Graph, iter_key_paths works on the node ids
+        try:
+            start_key = self.ids[start_node]
+            end_key = self.ids[end_node]
+        except KeyError:
+            return iter(())
+        return self.iter_key_paths(start_key, end_key, match_predicate, terminate_predicate, prune_predicate, limit, context, self.names)
 
-        # Put tuple pair into the priority queue
-        unvisited_queue = graph.get_nodes_unvisited()
-        heapq.heapify(unvisited_queue)
 
-        while len(unvisited_queue):
-            distance, node_current = heapq.heappop(unvisited_queue)
-            graph.set_node_visited(node_current)
-            del distance
+class DijkstraSearch(object):
+    def __init__(self, graph, node_from):
+        self.graph = graph
+        self.node_from = node_from
+        self.key_from = graph.node_key(node_from)
+        self.distances = {self.key_from: 0}
+        self.previous = dict()
+        self.settled = set()
+        self.queue = [(0, self.key_from)]
 
-            for node_adj in graph.vertex_map.get(node_current, {}).keys():
-                if graph.vertex_map[node_current][node_adj].get('visited', False):
-                    continue
-                new_dist = graph.get_node_distance(node_current) + graph.vertex_map[node_current][node_adj]['distance']
-                if new_dist < graph.get_node_distance(node_adj):
-                    graph.set_node_distance(node_adj, new_dist)
-                    graph.set_node_previous(node_adj, node_current)
+    def run(self, key_to=None):
+        distances = self.distances
+        previous = self.previous
+        settled = self.settled
+        queue = self.queue
+        adjacent = self.graph.adjacent
+        while queue and key_to not in settled:
+            distance, node_current = heapq.heappop(queue)
+            if node_current in settled:
+                # Stale entry, the node was pushed again with a shorter distance
+                continue
+            settled.add(node_current)
+            for node_adj, edge_distance in adjacent(node_current):
+                new_dist = distance + edge_distance
+                if new_dist < distances.get(node_adj, math.inf):
+                    distances[node_adj] = new_dist
+                    previous[node_adj] = node_current
+                    heapq.heappush(queue, (new_dist, node_adj))
+        return self
 
-            # Rebuild heap
-            # 1. Pop every item
-            while len(unvisited_queue):
-                heapq.heappop(unvisited_queue)
+    def get_node_distance(self, node):
+        if node != self.node_from and not self.graph.has_node(node):
+            raise KeyError(node)
+        key = self.graph.node_key(node)
+        self.run(key)
+        return self.get_key_distance(key)
 
-            # 2. Put all vertices not visited into the queue
-            unvisited_queue = graph.get_nodes_unvisited()
-            heapq.heapify(unvisited_queue)
+    def step(self):
+        # Settles the next node and returns its key, None once the search is exhausted
+        queue = self.queue
+        while queue:
+            distance, node_current = heapq.heappop(queue)
+            if self.is_key_settled(node_current):
+                continue
+            self.settle_key(node_current)
+            for node_adj, edge_distance in self.graph.adjacent(node_current):
+                new_dist = distance + edge_distance
+                if new_dist < self.get_key_distance(node_adj):
+                    self.distances[node_adj] = new_dist
+                    self.previous[node_adj] = node_current
+                    heapq.heappush(queue, (new_dist, node_adj))
+            return node_current
+        return None
 
-        return graph
+    def get_key_distance(self, key):
+        return self.distances.get(key, math.inf)
+
+    def is_key_settled(self, key):
+        return key in self.settled
+
+    def settle_key(self, key):
+        self.settled.add(key)
+
+    def get_settled_count(self):
+        return len(self.settled)
+
+    def get_key_path(self, key):
+        path = [key]
+        while key != self.key_from:
+            key = self.previous[key]
+            path.append(key)
+        path.reverse()
+        return path
+
+    def get_node_path(self, node):
+        if math.isinf(self.get_node_distance(node)):
+            raise GraphException('No path to the node', node)
+        return [self.graph.node_name(key) for key in self.get_key_path(self.graph.node_key(node))]
+
+
+class AStarSearch(DijkstraSearch):
+    # Queue ordered by distance plus heuristic(key), a consistent lower bound of the
+    # distance left to the target; nodes with an infinite bound are never queued
+    def __init__(self, graph, node_from, heuristic):
+        DijkstraSearch.__init__(self, graph, node_from)
+        self.heuristic = heuristic
+        self.queue = [(heuristic(self.key_from), self.key_from)]
+
+    def run(self, key_to=None):
+        distances = self.distances
+        previous = self.previous
+        settled = self.settled
+        queue = self.queue
+        adjacent = self.graph.adjacent
+        heuristic = self.heuristic
+        while queue and key_to not in settled:
+            _, node_current = heapq.heappop(queue)
+            if node_current in settled:
+                continue
+            settled.add(node_current)
+            distance = distances[node_current]
+            for node_adj, edge_distance in adjacent(node_current):
+                new_dist = distance + edge_distance
+                if new_dist < distances.get(node_adj, math.inf):
+                    estimate = heuristic(node_adj)
+                    if math.isinf(estimate):
+                        continue
+                    distances[node_adj] = new_dist
+                    previous[node_adj] = node_current
+                    heapq.heappush(queue, (new_dist + estimate, node_adj))
+        return self
+
+
+class CompactDijkstraSearch(DijkstraSearch):
+    # Same search over CompactGraph arrays, with list/bytearray state indexed by node id
+    def __init__(self, graph, node_from):
+        DijkstraSearch.__init__(self, graph, node_from)
+        node_count = len(graph.names)
+        self.distances = [math.inf] * node_count
+        self.distances[self.key_from] = 0
+        self.previous = [-1] * node_count
+        self.settled = bytearray(node_count)
+
+    def run(self, key_to=None):
+        offsets = self.graph.offsets
+        targets = self.graph.targets
+        weights = self.graph.weights
+        distances = self.distances
+        previous = self.previous
+        settled = self.settled
+        queue = self.queue
+        while queue and (key_to is None or not settled[key_to]):
+            distance, node_current = heapq.heappop(queue)
+            if settled[node_current]:
+                continue
+            settled[node_current] = 1
+            start = offsets[node_current]
+            end = offsets[node_current + 1]
+            for node_adj, weight in zip(targets[start:end], weights[start:end]):
+                new_dist = distance + weight
+                if new_dist < distances[node_adj]:
+                    distances[node_adj] = new_dist
+                    previous[node_adj] = node_current
+                    heapq.heappush(queue, (new_dist, node_adj))
+        return self
+
+    def get_key_distance(self, key):
+        return self.distances[key]
+
+    def is_key_settled(self, key):
+        return self.settled[key]
+
+    def settle_key(self, key):
+        self.settled[key] = 1
+
+    def get_settled_count(self):
+        return self.settled.count(1)
+
+
+class Landmarks(object):
+    # ALT heuristic: exact distances from and to a few landmark nodes give by the triangle
+    # inequality the lower bound max(d(L, t) - d(L, v), d(v, L) - d(t, L)) for d(v, t)
+    def __init__(self, graph, nodes):
+        self.graph = graph
+        self.nodes = list(nodes)
+        graph_reversed = graph.reversed()
+        self.distances_from = [graph.search(node).run() for node in self.nodes]
+        self.distances_to = [graph_reversed.search(node).run() for node in self.nodes]
+
+    @classmethod
+    def farthest(cls, graph, count):
+        # Each next landmark is the node farthest from the ones picked so far
+        keys = list(graph.node_keys())
+        if not keys:
+            return cls(graph, [])
+        nodes = [graph.node_name(keys[0])]
+        nearest = dict()
+        while len(nodes) < count:
+            search = graph.search(nodes[-1]).run()
+            for key in keys:
+                distance = search.get_key_distance(key)
+                if not math.isinf(distance):
+                    nearest[key] = min(nearest.get(key, math.inf), distance)
+            candidates = [key for key in nearest if graph.node_name(key) not in nodes]
+            if not candidates:
+                break
+            nodes.append(graph.node_name(max(candidates, key=nearest.__getitem__)))
+        return cls(graph, nodes)
+
+    def heuristic(self, node_to):
+        key_to = self.graph.node_key(node_to)
+        bounds = [(search_from.get_key_distance(key_to), search_from, search_to.get_key_distance(key_to), search_to)
+                  for (search_from, search_to) in zip(self.distances_from, self.distances_to)]
+
+        def estimate(key):
+            result = 0
+            for landmark_to_target, search_from, target_to_landmark, search_to in bounds:
+                landmark_to_node = search_from.get_key_distance(key)
+                if not math.isinf(landmark_to_target):
+                    if math.isinf(landmark_to_node):
+                        continue
+                    result = max(result, landmark_to_target - landmark_to_node)
+                elif not math.isinf(landmark_to_node):
+                    # The landmark reaches the node but not the target, so the node cannot either
+                    return math.inf
+                node_to_landmark = search_to.get_key_distance(key)
+                if not math.isinf(target_to_landmark) and not math.isinf(node_to_landmark):
+                    result = max(result, node_to_landmark - target_to_landmark)
+            return result
+        return estimate
+
+
+class DynamicShortestPaths(object):
+    # Shortest distances from watched sources, kept up to date while the Graph changes.
+    # Inserts and decreases re-relax only the improved region, increases and deletes
+    # of a shortest path tree edge mark the source stale until its next query
+    def __init__(self, graph, sources=()):
+        self.graph = graph
+        self.searches = dict()
+        self.stale = set()
+        self.touched_last = 0
+        self.touched_total = 0
+        for source in sources:
+            self.watch(source)
+
+    def watch(self, source):
+        search = self.searches[source] = self.graph.search(source).run()
+        self.stale.discard(source)
+        return len(search.settled)
+
+    def add_vertex(self, node_from, node_to, distance):
+        distance_old = self.graph.vertex_map.get(node_from, {}).get(node_to, {}).get('distance')
+        self.graph.add_vertex(node_from, node_to, {'distance': distance})
+        if distance_old is not None and distance > distance_old:
+            return self.invalidate(node_from, node_to)
+        touched = 0
+        for source, search in self.searches.items():
+            if source not in self.stale:
+                touched += self.relax(search, node_from, node_to, distance)
+        return self.count_touched(touched)
+
+    def remove_vertex(self, node_from, node_to):
+        self.graph.remove_vertex(node_from, node_to)
+        return self.invalidate(node_from, node_to)
+
+    def invalidate(self, node_from, node_to):
+        for source, search in self.searches.items():
+            if search.previous.get(node_to) == node_from:
+                self.stale.add(source)
+        return self.count_touched(0)
+
+    def relax(self, search, node_from, node_to, distance):
+        distances = search.distances
+        new_dist = distances.get(node_from, math.inf) + distance
+        if not new_dist < distances.get(node_to, math.inf):
+            return 0
+        distances[node_to] = new_dist
+        search.previous[node_to] = node_from
+        touched = 0
+        queue = [(new_dist, node_to)]
+        while queue:
+            distance_current, node_current = heapq.heappop(queue)
+            if distance_current > distances[node_current]:
+                continue
+            search.settled.add(node_current)
+            touched += 1
+            for node_adj, edge_distance in self.graph.adjacent(node_current):
+                new_dist = distance_current + edge_distance
+                if new_dist < distances.get(node_adj, math.inf):
+                    distances[node_adj] = new_dist
+                    search.previous[node_adj] = node_current
+                    heapq.heappush(queue, (new_dist, node_adj))
+        return touched
+
+    def count_touched(self, touched):
+        self.touched_last = touched
+        self.touched_total += touched
+        return touched
+
+    def get_node_distance(self, source, node):
+        if source in self.stale:
+            self.count_touched(self.watch(source))
+        return self.searches[source].get_node_distance(node)
+
+
+class DistanceIndex(object):
+    # All pairs distances and predecessors in one file, memory mapped on load.
+    # Layout: header, name lengths (uint32), names (utf-8), padding to 8 bytes,
+    # distances (int64, -1 when unreachable), predecessors (int32, -1 for none), row per source
+    MAGIC = b'T1DI'
+    VERSION = 1
+    HEADER = struct.Struct('<4sIBxxxQ32sQ')
+
+    def __init__(self, names, distances, previous, checksum, mapping=None):
+        self.names = names
+        self.ids = {name: node_id for node_id, name in enumerate(names)}
+        self.distances = distances
+        self.previous = previous
+        self.checksum = checksum
+        self.mapping = mapping
+
+    @classmethod
+    def layout(cls, node_count, names_size):
+        distances_offset = cls.HEADER.size + 4 * node_count + names_size
+        distances_offset += -distances_offset % 8
+        previous_offset = distances_offset + 8 * node_count * node_count
+        return distances_offset, previous_offset, previous_offset + 4 * node_count * node_count
+
+    @classmethod
+    def build(cls, graph, path):
+        if not isinstance(graph, CompactGraph):
+            graph = CompactGraph.from_graph(graph)
+        node_count = len(graph.names)
+        names = pack_names(graph.names)
+        distances_offset, previous_offset, size = cls.layout(node_count, len(names) - 4 * node_count)
+        with open(path, 'wb') as index_file:
+            index_file.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, sys.byteorder == 'little', node_count, graph.checksum(), len(names) - 4 * node_count))
+            index_file.write(names)
+            index_file.truncate(size)
+            for node_id in range(node_count):
+                search = CompactDijkstraSearch(graph, graph.names[node_id]).run()
+                index_file.seek(distances_offset + 8 * node_count * node_id)
+                index_file.write(array.array('q', [-1 if math.isinf(distance) else distance for distance in search.distances]).tobytes())
+                index_file.seek(previous_offset + 4 * node_count * node_id)
+                index_file.write(array.array('i', search.previous).tobytes())
+        return cls.load(path)
+
+    @classmethod
+    def load(cls, path, graph=None):
+        with open(path, 'rb') as index_file:
+            mapping = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, little_endian, node_count, checksum, names_size = cls.HEADER.unpack_from(mapping, 0)
+            if magic != cls.MAGIC or version != cls.VERSION:
+                raise GraphException('Unsupported distance index', path)
+            if bool(little_endian) != (sys.byteorder == 'little'):
+                raise GraphException('Distance index byte order does not match this machine', path)
+            if graph is not None and graph.checksum() != checksum:
+                raise GraphException('Distance index is stale', path)
+            names, position = unpack_names(mapping, cls.HEADER.size, node_count)
+            distances_offset, previous_offset, size = cls.layout(node_count, names_size)
+            view = memoryview(mapping)
+            distances = view[distances_offset:previous_offset].cast('q')
+            previous = view[previous_offset:size].cast('i')
+        except Exception:
+            mapping.close()
+            raise
+        return cls(names, distances, previous, checksum, mapping)
+
+    def close(self):
+        self.distances.release()
+        self.previous.release()
+        if self.mapping is not None:
+            self.mapping.close()
+
+    def is_stale(self, graph):
+        return graph.checksum() != self.checksum
+
+    def get_distance(self, node_from, node_to):
+        distance = self.distances[self.ids[node_from] * len(self.names) + self.ids[node_to]]
+        return math.inf if distance < 0 else distance
+
+    def get_route(self, node_from, node_to):
+        if math.isinf(self.get_distance(node_from, node_to)):
+            raise GraphException('No path to the node', node_to)
+        row = self.ids[node_from] * len(self.names)
+        key = self.ids[node_to]
+        route = [node_to]
+        while key != self.ids[node_from]:
+            key = self.previous[row + key]
+            route.append(self.names[key])
+        route.reverse()
+        return route
 
 
 class GraphException(Exception):
     pass
 
 
-def main():
-    graph = Graph.from_str(sys.stdin.read())
-    # Output 1
-    sys.stdout.write('Output #1: ')
-    try:
-        sys.stdout.write('%d\n' % graph.distance_nodes(['A', 'B', 'C']))
-    except GraphException:
-        sys.stdout.write('NO SUCH ROUTE\n')
-    # Output 2
-    sys.stdout.write('Output #2: ')
-    try:
-        sys.stdout.write('%d\n' % graph.distance_nodes(['A', 'D']))
-    except GraphException:
-        sys.stdout.write('NO SUCH ROUTE\n')
-    # Output 3
-    sys.stdout.write('Output #3: ')
-    try:
-        sys.stdout.write('%d\n' % graph.distance_nodes(['A', 'D', 'C']))
-    except GraphException:
-        sys.stdout.write('NO SUCH ROUTE\n')
-    # Output 4
-    sys.stdout.write('Output #4: ')
-    try:
-        sys.stdout.write('%d\n' % graph.distance_nodes(['A', 'E', 'B', 'C', 'D']))
-    except GraphException:
-        sys.stdout.write('NO SUCH ROUTE\n')
-    # Output 5
-    sys.stdout.write('Output #5: ')
-    try:
-        sys.stdout.write('%d\n' % graph.distance_nodes(['A', 'E', 'D']))
-    except GraphException:
-        sys.stdout.write('NO SUCH ROUTE\n')
-    # Output 6
-    print('Output #6: %d' % len(graph.backtrack('C', 'C',
-                              lambda context: 0 < len(context.get('path', [])) <= 3,
-                              lambda context: len(context.get('path', [])) >= 3,
-                              )))
-    # Output 7
-    print('Output #7: %d' % len(graph.backtrack('A', 'C',
-                              lambda context: 0 < len(context.get('path', [])) == 4,
-                              lambda context: len(context.get('path', [])) >= 4,
-                              )))
-    # Output 8
-    processed_graph = graph.dijkstra('A')
+# Query file format, one query per line:
+#   distance A B C      distance of the route A-B-C
+#   stops C C 1 3       number of trips from C to C with 1 to 3 stops
+#   within C C 30       number of trips from C to C shorter than 30
+#   shortest A C        length of the shortest route from A to C
+#   loop B 10           length of the shortest loop through B with at most 10 stops
+DEFAULT_QUERIES = [
+    'distance A B C',
+    'distance A D',
+    'distance A D C',
+    'distance A E B C D',
+    'distance A E D',
+    'stops C C 1 3',
+    'stops A C 4 4',
+    'shortest A C',
+    'loop B 10',
+    'within C C 30',
+]
+
+
+def parse_query(line):
+    tokens = line.split()
     try:
-        distance = processed_graph.get_node_distance('C')
-    except KeyError:
-        distance = math.inf
-    if not math.isinf(distance):
-        print('Output #8: %d' % distance)
-    else:
-        print('Output #8: NO PATH FOUND')
-    # Output 9
-    def match_predicate(context):
-        path = context.get('path', [])
-        path_len = len(path)
-        return path_len > 0 and len(set(path)) == path_len
-    loops = graph.backtrack('B', 'B',
-                            match_predicate,
-                            lambda context: len(context.get('path', [])) >= 10,
-                            )
-    del match_predicate
-    if loops:
-        print('Output #9: %d' % min([loop.get('distance') for loop in loops]))
+        kind = tokens[0]
+        if kind == 'distance' and len(tokens) >= 3:
+            return kind, tokens[1:]
+        elif kind == 'stops' and len(tokens) == 5:
+            return kind, tokens[1], tokens[2], int(tokens[3]), int(tokens[4])
+        elif kind == 'within' and len(tokens) == 4:
+            return kind, tokens[1], tokens[2], int(tokens[3])
+        elif kind == 'shortest' and len(tokens) == 3:
+            return kind, tokens[1], tokens[2]
+        elif kind == 'loop' and len(tokens) == 3:
+            return kind, tokens[1], int(tokens[2])
+    except (IndexError, ValueError):
+        pass
+    raise AssertionError('Unexpected query', line)
+
+
+def answer_query(graph, query):
+    kind = query[0]
+    if kind == 'distance':
+        try:
+            return '%d' % graph.distance_nodes(query[1])
+        except GraphException:
+            return 'NO SUCH ROUTE'
+    elif kind == 'stops':
+        return '%d' % graph.count_walks(*query[1:])
+    elif kind == 'within':
+        try:
+            return '%d' % graph.count_walks_within(*query[1:])
+        except GraphException:
+            return 'UNBOUNDED NUMBER OF TRIPS'
+    elif kind == 'shortest':
+        try:
+            distance = graph.shortest_distance(*query[1:])
+        except KeyError:
+            distance = math.inf
+        if not math.isinf(distance):
+            return '%d' % distance
+        return 'NO PATH FOUND'
+    elif kind == 'loop':
+        loop = graph.shortest_loop(*query[1:])
+        if loop is not None:
+            return '%d' % loop['distance']
+        return 'NO REQESTED LOOP'
+    raise AssertionError('Unexpected query', query)
+
+
+# Graph of the worker processes: inherited on fork, otherwise set once per worker by share_graph
+shared_graph = None
+
+
+def share_graph(graph):
+    global shared_graph
+    shared_graph = graph
+
+
+def answer_shared_query(query):
+    return answer_query(shared_graph, query)
+
+
+def run_queries(graph, queries, workers=1):
+    # Answers in the order of queries
+    if workers <= 1:
+        return [answer_query(graph, query) for query in queries]
+    if isinstance(graph, Graph):
+        graph = graph.freeze()
+    share_graph(graph)
+    if 'fork' in multiprocessing.get_all_start_methods():
+        executor = concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
     else:
-        print('Output #9: NO REQESTED LOOP')
-    # Output 10
-    print('Output #10: %d' % len(graph.backtrack('C', 'C',
-                                    lambda context: 0 < context.get('distance', []) < 30,
-                                    lambda context: context.get('distance', 0) >= 30,
-                              )))
+        # The graph is pickled once per worker, a loaded graph with copies of its mapped arrays
+        executor = concurrent.futures.ProcessPoolExecutor(workers, initializer=share_graph, initargs=(graph,))
+    with executor:
+        chunksize = max(1, len(queries) // (workers * 4))
+        return list(executor.map(answer_shared_query, queries, chunksize=chunksize))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Routes between towns')
+    parser.add_argument('--graph', help='edge list file, stdin by default')
+    parser.add_argument('--format', default='compact', choices=['compact', 'csv', 'tsv', 'binary'],
+                        help='compact: AB5, BC4, ...; csv/tsv: from,to,distance rows; binary: file written by --save-graph')
+    parser.add_argument('--save-graph', help='save the graph in the binary format and exit')
+    parser.add_argument('--stats', action='store_true', help='report load time and peak memory on stderr')
+    parser.add_argument('--queries', help='query file, one query per line; the ten reference queries by default')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes for the queries')
+    args = parser.parse_args()
+    if args.format == 'binary' and args.graph is None:
+        parser.error('--format binary needs --graph, a binary graph is not read from stdin')
+
+    started = time.perf_counter()
+    with load_graph(args.graph, args.format) as graph:
+        if args.stats:
+            # Unix only, imported where it is needed
+            import resource
+            sys.stderr.write('Loaded %d nodes, %d edges in %.3fs, peak RSS %d KiB\n' % (
+                len(graph.names), len(graph.targets), time.perf_counter() - started,
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+        if args.save_graph:
+            graph.save(args.save_graph)
+            return
+        if args.queries:
+            with open(args.queries) as queries_file:
+                queries = [parse_query(line) for line in queries_file if line.strip()]
+        else:
+            queries = [parse_query(line) for line in DEFAULT_QUERIES]
+
+        for number, answer in enumerate(run_queries(graph, queries, args.workers), 1):
+            print('Output #%d: %s' % (number, answer))
+
 
 if __name__ == '__main__':
     main()
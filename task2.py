@@ -2,25 +2,170 @@
 
 import sys
 import re
+import time
+import random
+import argparse
 import operator
 import functools
+import array
+import multiprocessing
+
+
+def format_time(minutes):
+    hours = minutes // 60 % 24
+    return '%02d:%02d%s' % ((hours - 1) % 12 + 1, minutes % 60, hours < 12 and 'AM' or 'PM')
 
 
 class Conference(object):
+    MORNING_START = 9 * 60
+    EVENING_START = 13 * 60
+
     def __init__(self):
+        self.tracks = list()
         self.sessions = list()
         self.session_pointer = -1
 
+    def add_track(self, track):
+        self.tracks.append(track)
+        self.sessions += [track.session1, track.session2]
+
     def add_item(self, item, duration):
-        pass
+        # First session from the pointer on that still takes the item
+        for session_index in range(max(self.session_pointer, 0), len(self.sessions)):
+            if self.sessions[session_index].try_add(item, duration):
+                self.session_pointer = session_index
+                return True
+        return False
 
     def remove_item(self, item, duration):
-        pass
+        for session in self.sessions:
+            if (item, duration) in session.items:
+                session.remove(item, duration)
+                return True
+        return False
 
     def is_valid(self):
-        return functools.reduce(operator.and_, map(lambda session: session.is_valid(), self.sessions))
+        return functools.reduce(operator.and_, map(lambda session: session.is_valid(), self.sessions), True)
+
+    def talks(self):
+        return [talk for session in self.sessions for talk in session.items]
+
+    def insert_talk(self, item, duration):
+        # Adds a talk to the session it breaks least and repairs from there, returns the
+        # number of sessions changed. On ScheduleRequestException the conference is left
+        # as it was
+        if not self.sessions:
+            return self.reschedule(self.talks() + [(item, duration)])
+        raw_duration = Session.raw_duration(duration)
+        session = min(self.sessions, key=lambda session: session.violation(session.duration + raw_duration) - session.violation())
+        checkpoint = self.checkpoint()
+        session.add(item, duration)
+        return self.repair_or_restore([session], checkpoint)
+
+    def withdraw_talk(self, item, duration):
+        # Removes a talk and repairs its session, returns the number of sessions changed.
+        # On ScheduleRequestException the conference is left as it was
+        for session in self.sessions:
+            if (item, duration) in session.items:
+                checkpoint = self.checkpoint()
+                session.remove(item, duration)
+                return self.repair_or_restore([session], checkpoint)
+        raise ScheduleRequestException('Talk is not scheduled', item)
+
+    def checkpoint(self):
+        return [list(session.items) for session in self.sessions]
+
+    def repair_or_restore(self, sessions, checkpoint):
+        try:
+            return self.repair(sessions)
+        except ScheduleRequestException:
+            # reschedule only replaces the sessions once solved, the talks moved so far go back
+            for session, items in zip(self.sessions, checkpoint):
+                session.items = items
+                session.duration = sum(Session.raw_duration(duration) for (_, duration) in items)
+            raise
+
+    def repair(self, sessions, max_steps=64):
+        # Local search from the sessions just changed: the most broken one takes the move
+        # (one talk to or from another session) or swap (one talk each way) lowering the
+        # total violation most. Sessions not touched keep their talks; a full reschedule
+        # is the fallback when the search gets stuck. Returns the number of sessions changed
+        changed = list(sessions)
+        for _ in range(max_steps):
+            broken = [session for session in changed if session.violation()]
+            if not broken:
+                return len(changed)
+            session = max(broken, key=lambda session: session.violation())
+            move = self.best_move(session)
+            if move is None:
+                break
+            other, talk_out, talk_in = move
+            if talk_out is not None:
+                session.remove(*talk_out)
+                other.add(*talk_out)
+            if talk_in is not None:
+                other.remove(*talk_in)
+                session.add(*talk_in)
+            if other not in changed:
+                changed.append(other)
+        return self.reschedule()
+
+    def best_move(self, session):
+        # (other session, talk out of session, talk into session), a talk may be None;
+        # talks of equal duration are interchangeable, so one of each is tried
+        def distinct(talks):
+            by_duration = dict()
+            for talk in talks:
+                by_duration.setdefault(Session.raw_duration(talk[1]), talk)
+            return [(None, 0)] + [(talk, raw_duration) for (raw_duration, talk) in sorted(by_duration.items())]
+
+        best, best_delta = None, 0
+        outgoing = distinct(session.items)
+        for other in self.sessions:
+            if other is session:
+                continue
+            violation = session.violation() + other.violation()
+            for talk_in, duration_in in distinct(other.items):
+                for talk_out, duration_out in outgoing:
+                    shift = duration_in - duration_out
+                    if shift == 0:
+                        continue
+                    delta = session.violation(session.duration + shift) + other.violation(other.duration - shift) - violation
+                    if delta < best_delta:
+                        best, best_delta = (other, talk_out, talk_in), delta
+                        if delta == -violation:
+                            return best
+        return best
+
+    def reschedule(self, talks=None):
+        # Full solve over the talks scheduled now (or the given talks), returns the number
+        # of sessions changed
+        before = [sorted(session.items) for session in self.sessions]
+        conference = Scheduler(ScheduleRequest(self.talks() if talks is None else talks)).solve()
+        self.tracks, self.sessions = conference.tracks, conference.sessions
+        after = [sorted(session.items) for session in self.sessions]
+        return sum(1 for (items_before, items_after) in zip(before, after) if items_before != items_after) + abs(len(before) - len(after))
+
+    def format(self):
+        lines = list()
+        for track_number, track in enumerate(self.tracks, 1):
+            lines.append('Track %d:' % track_number)
+            minutes = self.MORNING_START
+            for item, duration in track.session1.items:
+                lines.append('%s %s' % (format_time(minutes), item))
+                minutes += Session.raw_duration(duration)
+            lines.append('%s Lunch' % format_time(12 * 60))
+            minutes = self.EVENING_START
+            for item, duration in track.session2.items:
+                lines.append('%s %s' % (format_time(minutes), item))
+                minutes += Session.raw_duration(duration)
+            lines.append('%s Networking Event' % format_time(max(minutes, 16 * 60)))
+        return lines
+
 
 class Session(object):
+    LIMITS = (0, 0)
+
     @staticmethod
     def raw_duration(duration):
         return duration == 'lightning' and 5 or duration
@@ -34,9 +179,14 @@ class Session(object):
         self.duration += self.raw_duration(duration)
 
     def remove(self, item, duration):
-        self.items.pop((item, duration))
+        self.items.remove((item, duration))
         self.duration -= self.raw_duration(duration)
 
+    def violation(self, duration=None):
+        # Minutes below or above the session limits, for the current or a given duration
+        duration = self.duration if duration is None else duration
+        return max(self.LIMITS[0] - duration, 0) + max(duration - self.LIMITS[1], 0)
+
     def try_add(self, item, duration):
         raise NotImplementedError
 
@@ -45,6 +195,8 @@ class Session(object):
 
 
 class MorningSession(Session):
+    LIMITS = (180, 180)
+
     def try_add(self, item, duration):
         if self.duration + self.raw_duration(duration) <= 180:
             self.add(item, duration)
@@ -57,6 +209,8 @@ class MorningSession(Session):
 
 
 class EveningSession(Session):
+    LIMITS = (180, 240)
+
     def try_add(self, item, duration):
         if self.duration + self.raw_duration(duration) <= 240:
             self.add(item, duration)
@@ -77,36 +231,471 @@ class Track(object):
         return self.session1.is_valid() and self.session2.is_valid()
 
 
+class TalkStore(object):
+    # Talks packed for large submissions: durations in a typed array (LIGHTNING marks a
+    # lightning talk), titles in one string table sliced by offsets. Titles appended
+    # are joined in blocks, and into the table when first read
+    LIGHTNING = -1
+    BLOCK = 4096
+
+    def __init__(self):
+        self.durations = array.array('q')
+        self.offsets = array.array('q', [0])
+        self.blocks = list()
+        self.pending = list()
+
+    def __len__(self):
+        return len(self.durations)
+
+    def append(self, title, duration):
+        self.extend(((title, duration),))
+
+    def extend(self, talks):
+        # (title, duration) pairs, the array and list methods are looked up once
+        lightning = self.LIGHTNING
+        append_duration, append_offset, append_title = self.durations.append, self.offsets.append, self.pending.append
+        pending = self.pending
+        offset = self.offsets[-1]
+        for title, duration in talks:
+            try:
+                append_duration(duration == 'lightning' and lightning or duration)
+            except OverflowError:
+                raise AssertionError('Duration value is not expected')
+            offset += len(title)
+            append_offset(offset)
+            append_title(title)
+            if len(pending) == self.BLOCK:
+                self.flush()
+
+    def flush(self):
+        self.blocks.append(''.join(self.pending))
+        del self.pending[:]
+
+    @property
+    def text(self):
+        if self.pending or len(self.blocks) != 1:
+            self.flush()
+            self.blocks = [''.join(self.blocks)]
+        return self.blocks[0]
+
+    def raw_duration(self, index):
+        duration = self.durations[index]
+        return duration == self.LIGHTNING and Session.raw_duration('lightning') or duration
+
+    def title(self, index):
+        return self.text[self.offsets[index]:self.offsets[index + 1]]
+
+    def talk(self, index):
+        duration = self.durations[index]
+        return self.title(index), duration == self.LIGHTNING and 'lightning' or duration
+
+
 class ScheduleRequest(object):
     def __init__(self, items):
-        self.items = items or list()
+        self.talks = TalkStore()
+        self.talks.extend(items or list())
+
+    @property
+    def items(self):
+        return [self.talks.talk(index) for index in range(len(self.talks))]
 
     @classmethod
     def from_lines(cls, lines):
-        def parser():
-            re_line = re.compile('.*\\b((\\d+)|(lightning)).*')
+        # The duration is the last number or "lightning" starting a word
+        match = re.compile('.*\\b(\\d+|lightning)').match
+
+        def talks():
             for line in lines:
                 line = line.strip()
-                re_line_match = re_line.match(line)
-                if re_line_match is None:
+                line_match = match(line)
+                if line_match is None:
                     raise AssertionError('Unexpected input', line)
-                duration = re_line_match.group(1)
-                if duration != 'lightning':
-                    try:
-                        duration = int(duration)
-                    except (TypeError, ValueError):
-                        raise AssertionError('Duration value is not expected')
-                yield line, duration
-        return cls(list(parser()))
+                duration = line_match.group(1)
+                yield line, duration == 'lightning' and duration or int(duration)
+        return cls(talks())
+
+    @classmethod
+    def from_stream(cls, stream, chunk_size=1 << 16):
+        # Reads chunk_size characters at a time instead of all lines up front
+        def lines():
+            rest = ''
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                chunk_lines = (rest + chunk).split('\n')
+                rest = chunk_lines.pop()
+                for line in chunk_lines:
+                    yield line
+            if rest:
+                yield rest
+        return cls.from_lines(lines())
+
+
+def subset_sums(durations, counts, limit, sums=1):
+    # Bitset of the sums up to limit (bit n set: n is reachable) of any choice of talks
+    # added to the sums already reachable; equal durations are added in groups of
+    # 1, 2, 4, ... talks instead of one by one
+    mask = (1 << (limit + 1)) - 1
+    for duration, count in zip(durations, counts):
+        group = 1
+        while count > 0:
+            taken = min(group, count)
+            sums |= (sums << (duration * taken)) & mask
+            count -= taken
+            group *= 2
+    return sums
+
+
+def has_sum_between(sums, low, high):
+    low = max(low, 0)
+    return high >= low and (sums >> low) & ((1 << (high - low + 1)) - 1) != 0
+
+
+class Feasibility(object):
+    # Necessary conditions checked before any search: every talk fits an evening, talks
+    # longer than a morning need an evening each, and the mornings (180 minutes each,
+    # 180 * track_count together) are reachable sums of the talks that fit a morning
+    def __init__(self, durations, counts, track_counts):
+        self.too_long = sum(count for (duration, count) in zip(durations, counts) if duration > Scheduler.EVENING[1])
+        self.evening_only = sum(count for (duration, count) in zip(durations, counts) if duration > Scheduler.MORNING[1])
+        morning_durations = [(duration, count) for (duration, count) in zip(durations, counts) if duration <= Scheduler.MORNING[1]]
+        self.morning_sums = subset_sums(
+            [duration for (duration, count) in morning_durations],
+            [count for (duration, count) in morning_durations],
+            Scheduler.MORNING[1] * max(track_counts or [0]))
+
+    def check(self, track_count):
+        # None when track_count passes, otherwise the reason it cannot be scheduled
+        if self.too_long:
+            return '%d talks are longer than an evening session' % self.too_long
+        if self.evening_only > track_count:
+            return '%d talks are longer than a morning session, %d evenings' % (self.evening_only, track_count)
+        if track_count and not self.morning_sums >> Scheduler.MORNING[1] & 1:
+            return 'no talks add up to a morning session'
+        if not self.morning_sums >> (Scheduler.MORNING[1] * track_count) & 1:
+            return 'no talks add up to %d morning sessions' % track_count
+        return None
+
+
+class Scheduler(object):
+    # Talks of equal duration are interchangeable, so the search assigns duration counts:
+    # every session takes a pattern (count per duration, durations descending), mornings
+    # first as they are the tighter constraint. Identical sessions are not told apart
+    # (symmetry breaking): the longest talk of a morning never grows from one morning to
+    # the next, and every evening holds the longest talk still unassigned. Failed
+    # (remaining counts, sessions left) states are memoized
+    MORNING = (180, 180)
+    EVENING = (180, 240)
+    # Patterns beyond one per session the search of each track count tries in its first turn
+    LIMIT = 256
+    MORNINGS_SUMMED = 32
+
+    def __init__(self, schedule_request, seed=None, deadline=None):
+        # seed: None for the plain search, otherwise random.Random(seed) shuffles the track
+        # counts and the durations morning patterns are filled with, and shifts the evening
+        # target sums; deadline: time.time() the search
+        # gives up at
+        self.talks = schedule_request.talks
+        self.seed = seed
+        self.random = seed is not None and random.Random(seed) or None
+        self.offset = self.random is not None and self.random.randint(-10, 10) or 0
+        self.deadline = deadline
+        # Talk indices by duration, titles are only read to build the conference
+        durations = dict()
+        for index in range(len(self.talks)):
+            raw_duration = self.talks.raw_duration(index)
+            if raw_duration <= 0:
+                raise ScheduleRequestException('Duration must be positive', self.talks.title(index))
+            durations.setdefault(raw_duration, array.array('i')).append(index)
+        self.durations = sorted(durations, reverse=True)
+        self.talks_by_duration = durations
+        self.counts = tuple(len(durations[duration]) for duration in self.durations)
+        self.total = sum(count * duration for (count, duration) in zip(self.counts, self.durations))
+        self.explored = 0
+
+    def track_counts(self):
+        # A track takes 360 to 420 minutes; counts leaving evenings the most slack come first
+        track_counts = list(range(-(-self.total // 420), self.total // 360 + 1))
+        track_counts.sort(key=lambda track_count: abs(self.total - 390 * track_count))
+        if self.random is not None:
+            self.random.shuffle(track_counts)
+        return track_counts
+
+    def solve(self):
+        track_counts = self.track_counts()
+        if not track_counts:
+            raise ScheduleRequestException('Total duration %d fits no whole number of tracks' % self.total)
+        feasibility = Feasibility(self.durations, self.counts, track_counts)
+        reasons = dict()
+        for track_count in track_counts:
+            reason = feasibility.check(track_count)
+            if reason is not None:
+                reasons[track_count] = reason
+        # Some track counts are far harder to search than others, so the searches take
+        # turns with a pattern limit (beyond one per session) doubled every round instead
+        # of running one to the end; what a search proved failed is kept for its next turn
+        pending = [track_count for track_count in track_counts if track_count not in reasons]
+        failed = dict((track_count, set()) for track_count in pending)
+        limit = self.LIMIT
+        while pending:
+            for track_count in list(pending):
+                try:
+                    patterns = self.search(track_count, failed[track_count], 2 * track_count + limit)
+                except SearchLimitException:
+                    continue
+                if patterns is not None:
+                    return self.build(track_count, patterns)
+                reasons[track_count] = 'search space exhausted for %d tracks' % track_count
+                pending.remove(track_count)
+            limit *= 2
+        raise ScheduleRequestException('No schedule for %d to %d tracks: %s' % (min(track_counts), max(track_counts), reasons[track_counts[0]]))
+
+    def duration_of(self, counts):
+        return sum(count * duration for (count, duration) in zip(counts, self.durations))
+
+    def talks_needed(self, remaining, minutes):
+        # Fewest talks left that add up to minutes: the longest ones
+        needed = 0
+        for duration, count in zip(self.durations, remaining):
+            if count * duration >= minutes:
+                return needed - (-minutes // duration)
+            needed += count
+            minutes -= count * duration
+        return needed + 1
+
+    def talks_fitting(self, remaining, minutes):
+        # Most talks left that fit into minutes: the shortest ones
+        fitting = 0
+        for duration, count in zip(reversed(self.durations), reversed(remaining)):
+            taken = min(count, minutes // duration)
+            fitting += taken
+            minutes -= taken * duration
+            if taken < count:
+                break
+        return fitting
+
+    def is_feasible(self, state):
+        # The minutes left must fit the sessions left, and so must the number of talks left:
+        # every session takes at least as many talks as the longest ones need to fill it
+        # and at most as many as the shortest ones fit into it. The mornings left only take
+        # durations from first on (symmetry breaking), those must add up to them; checked
+        # for the last MORNINGS_SUMMED mornings, the bitsets grow with the mornings
+        remaining, mornings, evenings, first = state
+        total = self.duration_of(remaining)
+        if not self.MORNING[0] * mornings + self.EVENING[0] * evenings <= total <= self.MORNING[1] * mornings + self.EVENING[1] * evenings:
+            return False
+        talk_count = sum(remaining)
+        needed = evenings * self.talks_needed(remaining, self.EVENING[0])
+        fitting = evenings * self.talks_fitting(remaining, self.EVENING[1])
+        if mornings:
+            needed += mornings * self.talks_needed(remaining, self.MORNING[0])
+            fitting += mornings * self.talks_fitting(remaining, self.MORNING[1])
+        if not needed <= talk_count <= fitting:
+            return False
+        if 0 < mornings <= self.MORNINGS_SUMMED:
+            sums = subset_sums(self.durations[first:], remaining[first:], self.MORNING[1] * mornings)
+            return has_sum_between(sums, self.MORNING[0] * mornings, self.MORNING[1] * mornings)
+        return True
+
+    def patterns(self, state):
+        # Patterns for the next session, longer talks first. Evenings try the sums closest
+        # to an even split of what is left first, so later evenings are not forced into
+        # exact sums
+        remaining, mornings, evenings, first = state
+        durations = self.durations
+        total = self.duration_of(remaining)
+        low, high = mornings and self.MORNING or self.EVENING
+        if mornings + evenings == 1:
+            # The last session takes whatever is left
+            if low <= total <= high:
+                yield remaining
+            return
+        # What the other sessions can take bounds this one
+        others_low = self.MORNING[0] * max(mornings - 1, 0) + self.EVENING[0] * (evenings - (not mornings))
+        others_high = self.MORNING[1] * max(mornings - 1, 0) + self.EVENING[1] * (evenings - (not mornings))
+        low = max(low, total - others_high)
+        high = min(high, total - others_low)
+        if mornings:
+            anchor = None
+            windows = [(low, high)]
+        else:
+            first = anchor = next(index for (index, count) in enumerate(remaining) if count)
+            sessions = evenings
+            windows = [(max(low, total // sessions + self.offset - width), min(high, -(-total // sessions) + self.offset + width)) for width in (0, 5, 15, 40)]
+            windows.append((low, high))
+
+        # Only durations with talks left are candidates (in random order for the mornings of
+        # a seeded search); reachable[position]: sums the candidates from position on can
+        # add, a branch that cannot reach the window is never entered
+        candidates = [index for index in range(first, len(durations)) if remaining[index]]
+        if mornings and self.random is not None:
+            candidates[1:] = sorted(candidates[1:], key=lambda index: -durations[index] * self.random.uniform(0.8, 1.25))
+        reachable = [1] * (len(candidates) + 1)
+        for position in range(len(candidates) - 1, -1, -1):
+            index = candidates[position]
+            reachable[position] = subset_sums((durations[index],), (remaining[index],), high, reachable[position + 1])
+        pattern = [0] * len(durations)
+
+        def fill(position, pattern_total, low, high):
+            if position == len(candidates) or pattern_total == high:
+                if low <= pattern_total <= high:
+                    yield tuple(pattern)
+                return
+            if not has_sum_between(reachable[position], low - pattern_total, high - pattern_total):
+                return
+            index = candidates[position]
+            count_max = min(remaining[index], (high - pattern_total) // durations[index])
+            count_min = index == anchor and 1 or 0
+            for count in range(count_max, count_min - 1, -1):
+                pattern[index] = count
+                for result in fill(position + 1, pattern_total + count * durations[index], low, high):
+                    yield result
+            pattern[index] = 0
+
+        window_previous = (1, 0)
+        for window in windows:
+            for result in fill(0, 0, window[0], window[1]):
+                if not window_previous[0] <= self.duration_of(result) <= window_previous[1]:
+                    yield result
+            window_previous = window
+
+    def search(self, track_count, failed=None, limit=None):
+        # Depth first over sessions on an explicit stack, deep enough for thousands of talks.
+        # failed: states known to fail, added to; limit: patterns tried before
+        # SearchLimitException is raised
+        start = (self.counts, track_count, track_count, 0)
+        if not self.is_feasible(start):
+            return None
+        if track_count == 0:
+            return list()
+        failed = failed if failed is not None else set()
+        tried = 0
+        chosen = list()
+        stack = [(start, self.patterns(start))]
+        while stack:
+            state, candidates = stack[-1]
+            pattern = next(candidates, None)
+            if pattern is None:
+                failed.add(state)
+                stack.pop()
+                if chosen:
+                    chosen.pop()
+                continue
+            self.explored += 1
+            tried += 1
+            if limit is not None and tried > limit:
+                raise SearchLimitException()
+            if self.deadline is not None and self.explored % 64 == 0 and time.time() > self.deadline:
+                raise ScheduleTimeoutException('No schedule found within the time budget')
+            remaining, mornings, evenings, first = state
+            remaining = tuple(count - used for (count, used) in zip(remaining, pattern))
+            if mornings > 1:
+                first = next(index for (index, count) in enumerate(pattern) if count)
+                state_next = (remaining, mornings - 1, evenings, first)
+            elif mornings:
+                state_next = (remaining, 0, evenings, 0)
+            else:
+                state_next = (remaining, 0, evenings - 1, 0)
+            if state_next[1] + state_next[2] == 0:
+                return chosen + [pattern]
+            if state_next in failed or not self.is_feasible(state_next):
+                continue
+            chosen.append(pattern)
+            stack.append((state_next, self.patterns(state_next)))
+        return None
+
+    def build(self, track_count, patterns):
+        items = dict((duration, self.talks_by_duration[duration][::-1]) for duration in self.durations)
+        sessions = list()
+        for pattern in patterns:
+            session = len(sessions) < track_count and MorningSession() or EveningSession()
+            for duration, count in zip(self.durations, pattern):
+                for _ in range(count):
+                    session.add(*self.talks.talk(items[duration].pop()))
+            sessions.append(session)
+        conference = Conference()
+        for morning, evening in zip(sessions[:track_count], sessions[track_count:]):
+            conference.add_track(Track(morning, evening))
+        if not conference.is_valid():
+            raise AssertionError('Scheduler built an invalid conference')
+        return conference
+
+
+def solve_strategy(task):
+    # Pool worker: (seed, conference or None, reason or None)
+    schedule_request, seed, deadline = task
+    try:
+        return seed, Scheduler(schedule_request, seed, deadline).solve(), None
+    except ScheduleTimeoutException:
+        return seed, None, None
+    except ScheduleRequestException as e:
+        return seed, None, e.args[0]
+
+
+def solve_portfolio(schedule_request, workers, seed=0, budget=None):
+    # Runs differently ordered searches in a process pool, the first to finish wins and
+    # the others are terminated. Every strategy is a complete search, so the first proof
+    # that no schedule exists ends the portfolio as well. Returns (seed, conference),
+    # Scheduler(schedule_request, seed) reproduces the conference
+    deadline = None if budget is None else time.time() + budget
+    # The first strategy is the unshuffled search
+    seeds = [None] + [seed + index for index in range(1, workers)]
+    tasks = [(schedule_request, strategy_seed, deadline) for strategy_seed in seeds]
+    pool = multiprocessing.Pool(workers)
+    try:
+        results = pool.imap_unordered(solve_strategy, tasks)
+        for index in range(workers):
+            try:
+                result_seed, conference, reason = results.next(None if deadline is None else max(deadline - time.time(), 0))
+            except multiprocessing.TimeoutError:
+                break
+            if conference is not None:
+                return result_seed, conference
+            if reason is not None:
+                raise ScheduleRequestException(reason)
+        raise ScheduleTimeoutException('No schedule found within %.1fs' % budget)
+    finally:
+        pool.terminate()
+        pool.join()
 
 
 class ScheduleRequestException(Exception):
     pass
 
 
+class ScheduleTimeoutException(ScheduleRequestException):
+    pass
+
+
+class SearchLimitException(Exception):
+    # Scheduler.search ran out of patterns for this turn
+    pass
+
+
 def main():
-    schedule_request = ScheduleRequest.from_lines(sys.stdin.readlines())
-    print(schedule_request.items)
+    parser = argparse.ArgumentParser(description='Conference track scheduler, talks on stdin')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes, each running a differently ordered search')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the shuffled search orders')
+    parser.add_argument('--budget', type=float, help='time budget in seconds')
+    args = parser.parse_args()
+
+    schedule_request = ScheduleRequest.from_stream(sys.stdin)
+    try:
+        if args.workers > 1:
+            seed, conference = solve_portfolio(schedule_request, args.workers, args.seed, args.budget)
+        else:
+            deadline = None if args.budget is None else time.time() + args.budget
+            conference = Scheduler(schedule_request, deadline=deadline).solve()
+    except ScheduleTimeoutException as e:
+        # Not a proof that no schedule exists
+        sys.stderr.write('Scheduling gave up: %s\n' % e.args[0])
+        sys.exit(2)
+    except ScheduleRequestException as e:
+        sys.stderr.write('Scheduling is not possible: %s\n' % e.args[0])
+        sys.exit(1)
+    for line in conference.format():
+        print(line)
 
 if __name__ == '__main__':
     main()
@@ -16,255 +16,996 @@
 
 
 import sys
-import operator
 import functools
+import operator
 import fractions
 import heapq
-import copy
 import math
+import collections
+import struct
+import mmap
+import codecs
+import io
+import time
+import argparse
+import decimal
+import array
 
 
 class TokenMap(object):
+    # Definitions as given in items; lookups go through resolved, a flat token -> roman
+    # digit map filled on first lookup. Redefining a token drops it and every alias
+    # resolving through it (aliases: token -> tokens defined as its aliases)
     def __init__(self):
         self.items = dict()
+        self.resolved = dict()
+        self.aliases = dict()
+
+    def define(self, token, mapping):
+        previous = self.items.get(token)
+        if previous is not None and previous['type'] == 'alias':
+            self.aliases[previous['value']].discard(token)
+        self.items[token] = mapping
+        if mapping['type'] == 'alias':
+            self.aliases.setdefault(mapping['value'], set()).add(token)
+        self.invalidate(token)
+
+    def invalidate(self, token):
+        stack = [token]
+        seen = set()
+        while stack:
+            token = stack.pop()
+            if token in seen:
+                continue
+            seen.add(token)
+            self.resolved.pop(token, None)
+            stack.extend(self.aliases.get(token, ()))
 
     def add_digit(self, token, value):
-        self.items[token] = {'type': 'roman_digit', 'value': value}
+        self.define(token, {'type': 'roman_digit', 'value': value})
 
     def add_alias(self, token, value):
-        self.items[token] = {'type': 'alias', 'value': value}
+        self.define(token, {'type': 'alias', 'value': value})
 
     def lookup_token(self, token):
-        result = None
-        while token in self.items:
+        # None for unknown tokens and alias cycles
+        digit = self.resolved.get(token)
+        if digit is not None:
+            return digit
+        chain = list()
+        while token in self.items and token not in chain:
+            chain.append(token)
             mapping = self.items[token]
             if mapping['type'] == 'roman_digit':
+                for alias in chain:
+                    self.resolved[alias] = mapping['value']
                 return mapping['value']
-            elif mapping['type'] == 'alias':
-                token = mapping['value']
-            else:
-                pass
+            token = mapping['value']
+        return None
 
     def lookup_tokens(self, tokens):
+        resolved = self.resolved
         for token in tokens:
-            digit = self.lookup_token(token)
+            digit = resolved.get(token) or self.lookup_token(token)
             if digit is not None:
                 yield digit
             else:
                 raise ValueError
 
 
-def roman_to_int(number_str):
-    number_str = number_str.upper()
-    nums = ['M', 'D', 'C', 'L', 'X', 'V', 'I']
-    ints = [1000, 500, 100, 50, 10, 5, 1]
-    places = []
-    for i in range(len(number_str)):
-        c = number_str[i]
-        value = ints[nums.index(c)]
-        # If the next place holds a larger number, this value is negative.
-        try:
-            if ints[nums.index(number_str[i + 1])] > value:
-                value *= -1
-        except IndexError:
-            # there is no next place.
-            pass
-        places.append(value)
-    return functools.reduce(operator.add, places, 0)
-
-
-class ConverterProcessed(object):
-    def set_node_rate(self, node, value):
-        self.currencies.setdefault(node, dict())['rate'] = value
-
-    def get_node_rate(self, node):
-        return self.currencies[node].get('rate', math.inf)
+ROMAN_DIGITS = frozenset(['I', 'V', 'X', 'L', 'C', 'D', 'M'])
 
-    def set_node_previous(self, node, value):
-        self.currencies.setdefault(node, dict())['previous'] = value
 
-    def set_node_visited(self, node):
-        self.currencies.setdefault(node, dict())['visited'] = True
+def roman_place_spellings(one, five, ten, value):
+    # (spelling, value) of the digits 1..9 of one place: at most three repeats of one, a
+    # single five, one subtracted only from the next five or ten
+    spellings = ['', one, one * 2, one * 3, one + five, five, five + one, five + one * 2, five + one * 3, one + ten]
+    return [(spelling, digit * value) for (digit, spelling) in enumerate(spellings) if digit and (five or digit < 4)]
 
-    def get_nodes_unvisited(self):
-        return [(node_options.get('rate', math.inf), node_key) for (node_key, node_options) in self.currencies.items() if not node_options.get('visited', False)]
 
-    def __init__(self, currencies, xchg_graph, currency_from):
-        self.currencies = copy.deepcopy(currencies)
-        self.xchg_graph = copy.deepcopy(xchg_graph)
+def roman_table():
+    # Deterministic state machine over the places, thousands first: a state is (place,
+    # spelling read so far in it), the start state (None, ''). A transition reads one
+    # character and gives the value change; every state but the start accepts
+    places = [dict(roman_place_spellings('M', '', '', 1000)),
+              dict(roman_place_spellings('C', 'D', 'M', 100)),
+              dict(roman_place_spellings('X', 'L', 'C', 10)),
+              dict(roman_place_spellings('I', 'V', 'X', 1))]
+    table = dict()
+    states = [(None, '')] + [(place, spelling) for (place, spellings) in enumerate(places) for spelling in spellings]
+    for place_from, spelling_from in states:
+        transitions = table.setdefault((place_from, spelling_from), dict())
+        value_from = place_from is not None and places[place_from][spelling_from] or 0
+        for place, spellings in enumerate(places):
+            if place_from is not None and place < place_from:
+                continue
+            for spelling, value in spellings.items():
+                if place == place_from and spelling[:-1] == spelling_from:
+                    transitions[spelling[-1]] = ((place, spelling), value - value_from)
+                elif place != place_from and len(spelling) == 1:
+                    transitions[spelling] = ((place, spelling), value)
+    return table
 
-        # Set the rate to one
-        self.set_node_rate(currency_from, 1)
 
-        # Put tuple pair into the priority queue
-        unvisited_queue = self.get_nodes_unvisited()
-        heapq.heapify(unvisited_queue)
+ROMAN_TABLE = roman_table()
 
-        while len(unvisited_queue):
-            distance, node_current = heapq.heappop(unvisited_queue)
-            self.set_node_visited(node_current)
-            del distance
 
-            for node_adj in self.xchg_graph.get(node_current, {}).keys():
-                if self.xchg_graph[node_current][node_adj].get('visited', False):
-                    continue
-                new_rate = self.get_node_rate(node_current) / self.xchg_graph[node_current][node_adj]['rate']
-                if not math.isinf(new_rate) and math.isinf(self.get_node_rate(node_adj)):
-                    self.set_node_rate(node_adj, new_rate)
-                    self.set_node_previous(node_adj, node_current)
-
-            # Rebuild heap
-            # 1. Pop every item
-            while len(unvisited_queue):
-                heapq.heappop(unvisited_queue)
-
-            # 2. Put all vertices not visited into the queue
-            unvisited_queue = self.get_nodes_unvisited()
-            heapq.heapify(unvisited_queue)
+@functools.lru_cache(maxsize=4096)
+def roman_to_int(number_str):
+    # Strict decoder, ValueError for anything but a well formed numeral from 1 to 3999
+    state = (None, '')
+    result = 0
+    for c in number_str.upper():
+        try:
+            state, value = ROMAN_TABLE[state][c]
+        except KeyError:
+            raise ValueError('Invalid roman numeral', number_str)
+        result += value
+    if not result:
+        raise ValueError('Invalid roman numeral', number_str)
+    return result
+
+
+def roman_to_ints(number_strs):
+    # Batch decoding, ValueError on the first invalid numeral
+    return [roman_to_int(number_str) for number_str in number_strs]
+
+
+ROUNDINGS = frozenset([decimal.ROUND_FLOOR, decimal.ROUND_CEILING, decimal.ROUND_DOWN, decimal.ROUND_UP,
+                       decimal.ROUND_HALF_EVEN, decimal.ROUND_HALF_UP, decimal.ROUND_HALF_DOWN])
+
+
+def divide_rounded(numerator, denominator, rounding=decimal.ROUND_HALF_EVEN):
+    # numerator / denominator rounded to an integer exactly, rounding is one of the
+    # decimal module rounding modes (ROUND_05UP excluded)
+    if rounding not in ROUNDINGS:
+        raise ValueError('Unsupported rounding', rounding)
+    if denominator < 0:
+        numerator, denominator = -numerator, -denominator
+    quotient, remainder = divmod(numerator, denominator)
+    if not remainder or rounding == decimal.ROUND_FLOOR:
+        return quotient
+    if rounding == decimal.ROUND_CEILING:
+        return quotient + 1
+    if rounding == decimal.ROUND_DOWN:
+        return quotient + (numerator < 0)
+    if rounding == decimal.ROUND_UP:
+        return quotient + (numerator > 0)
+    if 2 * remainder != denominator:
+        return quotient + (2 * remainder > denominator)
+    if rounding == decimal.ROUND_HALF_EVEN:
+        return quotient + quotient % 2
+    if rounding == decimal.ROUND_HALF_UP:
+        return quotient + (numerator > 0)
+    # ROUND_HALF_DOWN
+    return quotient + (numerator < 0)
+
+
+def to_fixed(value, places=6, rounding=decimal.ROUND_HALF_EVEN):
+    # value * 10 ** places as an integer
+    value = fractions.Fraction(value)
+    return divide_rounded(value.numerator * 10 ** places, value.denominator, rounding)
+
+
+def format_fixed(value, places=6):
+    # Decimal text of a to_fixed integer
+    if not places:
+        return '%d' % value
+    integer, fraction = divmod(abs(value), 10 ** places)
+    return '%s%d.%0*d' % (value < 0 and '-' or '', integer, places, fraction)
+
+
+def fraction_log(value):
+    # Natural logarithm of a positive Fraction, its terms may be beyond the float range
+    return math.log(value.numerator) - math.log(value.denominator)
+
+
+class RateCache(object):
+    # LRU of traversed rates keyed by (currency_from, currency_to). Every entry lists the
+    # connected components its result depends on, so a change to one component drops
+    # only the entries that saw it
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.items = collections.OrderedDict()
+        self.keys_by_component = dict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key):
+        # None on a miss
+        try:
+            rate, components = self.items[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self.items.move_to_end(key)
+        self.hits += 1
+        return rate
+
+    def put(self, key, rate, components):
+        if self.maxsize <= 0:
+            return
+        self.discard(key)
+        self.items[key] = (rate, components)
+        for component in components:
+            self.keys_by_component.setdefault(component, set()).add(key)
+        if len(self.items) > self.maxsize:
+            self.discard(next(iter(self.items)))
+
+    def discard(self, key):
+        entry = self.items.pop(key, None)
+        if entry is None:
+            return
+        for component in entry[1]:
+            keys = self.keys_by_component[component]
+            keys.discard(key)
+            if not keys:
+                del self.keys_by_component[component]
+
+    def invalidate(self, component):
+        for key in list(self.keys_by_component.get(component, ())):
+            self.discard(key)
+
+    def clear(self):
+        self.items.clear()
+        self.keys_by_component.clear()
+
+
+class ExchangePaths(object):
+    # Best conversion paths over every quote: the accepted ones of xchg_graph and the
+    # rejected ones of conflicts, so one pair may have several edges. Converting along an
+    # edge multiplies by a rate, so every edge weighs -log(rate) and the best rate is the
+    # shortest path. Bellman-Ford (queue based) from the given potentials (log of the
+    # union-find ratios, which already settle every accepted quote) finds the negative
+    # cycles, i.e. arbitrage loops; their components have no best rate. Other queries run
+    # Dijkstra on the weights reduced by the potentials, the rate of the chosen path is
+    # recomputed exactly with the Fractions of its quotes
+    EPSILON = 1e-9
+
+    def __init__(self, xchg_graph, conflicts=(), potentials=None):
+        self.names = list(xchg_graph)
+        self.index = dict(zip(self.names, range(len(self.names))))
+        index = self.index
+        # edges[node] = [(node_adj, weight, rate)]: one unit of node is worth rate
+        # (exp(-weight)) units of node_adj
+        self.edges = [[(index[node_adj], -fraction_log(xchg_graph[node_adj][name]['rate']), xchg_graph[node_adj][name]['rate'])
+                       for node_adj in xchg_graph[name]] for name in self.names]
+        for currency_from, value_from, currency_to, value_to in conflicts:
+            rate = fractions.Fraction(value_to) / value_from
+            for name_from, name_to, rate_edge in ((currency_from, currency_to, rate), (currency_to, currency_from, 1 / rate)):
+                for name in (name_from, name_to):
+                    if name not in index:
+                        index[name] = len(self.names)
+                        self.names.append(name)
+                        self.edges.append(list())
+                self.edges[index[name_from]].append((index[name_to], -fraction_log(rate_edge), rate_edge))
+        potentials = potentials or dict()
+        self.distances = [potentials.get(name, 0.0) for name in self.names]
+        # [(loop of currencies, back to the first one), gain of one round as a Fraction)]
+        self.loops = list()
+        self.loops_seen = set()
+        self.unbounded = bytearray(len(self.names))
+        self.settled = 0
+        self.bellman_ford()
+        self.conflict_loops(xchg_graph, conflicts)
+        self.spread_unbounded()
+
+    def bellman_ford(self):
+        count = len(self.names)
+        edges, distances, unbounded = self.edges, self.distances, self.unbounded
+        # previous[node] = (node before it, rate of the edge between them)
+        previous = [None] * count
+        queue = collections.deque(range(count))
+        queued = bytearray(b'\x01') * count
+        relaxed = 0
+        while queue:
+            node = queue.popleft()
+            queued[node] = 0
+            if unbounded[node]:
+                continue
+            distance = distances[node]
+            for node_adj, weight, rate in edges[node]:
+                new_distance = distance + weight
+                if new_distance < distances[node_adj] - self.EPSILON and not unbounded[node_adj]:
+                    distances[node_adj] = new_distance
+                    previous[node_adj] = (node, rate)
+                    if not queued[node_adj]:
+                        queued[node_adj] = 1
+                        queue.append(node_adj)
+                    relaxed += 1
+                    # A negative cycle shows up as a cycle of the previous links, looked for
+                    # once per count relaxations
+                    if relaxed % count == 0:
+                        self.find_loops(previous)
+        self.find_loops(previous)
+
+    def conflict_loops(self, xchg_graph, conflicts):
+        # Every rejected quote closes a loop with the accepted quotes between its two
+        # currencies, and its gain is exactly not 1: no loop is lost below EPSILON
+        paths = dict()
+        for currency_from, value_from, currency_to, value_to in conflicts:
+            key = (currency_from, currency_to)
+            if key not in paths:
+                paths[key] = self.accepted_path(xchg_graph, currency_to, currency_from)
+            path = paths[key]
+            rates = [xchg_graph[name_to][name_from]['rate'] for (name_from, name_to) in zip(path[:-1], path[1:])]
+            gain = functools.reduce(operator.mul, rates, fractions.Fraction(value_to) / value_from)
+            if gain > 1:
+                # The rejected quote, then the accepted ones back
+                self.add_named_loop([currency_from] + path, gain)
+            else:
+                # The accepted quotes, then the rejected one back
+                self.add_named_loop(path[::-1] + [currency_from], 1 / gain)
+            for name in path:
+                self.unbounded[self.index[name]] = 1
+
+    @staticmethod
+    def accepted_path(xchg_graph, currency_from, currency_to):
+        # Fewest accepted quotes from currency_from to currency_to, both in one component
+        previous = {currency_from: None}
+        queue = collections.deque([currency_from])
+        while currency_to not in previous:
+            name = queue.popleft()
+            for name_adj in xchg_graph[name]:
+                if name_adj not in previous:
+                    previous[name_adj] = name
+                    queue.append(name_adj)
+        path = list()
+        name = currency_to
+        while name is not None:
+            path.append(name)
+            name = previous[name]
+        path.reverse()
+        return path
+
+    def spread_unbounded(self):
+        # Arbitrage reaches everything connected to its loop, quotes go both ways
+        edges, unbounded = self.edges, self.unbounded
+        stack = [node for node in range(len(self.names)) if unbounded[node]]
+        while stack:
+            for node_adj, _, _ in edges[stack.pop()]:
+                if not unbounded[node_adj]:
+                    unbounded[node_adj] = 1
+                    stack.append(node_adj)
+
+    def find_loops(self, previous):
+        # Records every cycle of the previous links and marks its currencies unbounded
+        state = bytearray(len(previous))
+        for start in range(len(previous)):
+            path = list()
+            node = start
+            while previous[node] is not None and not state[node] and not self.unbounded[node]:
+                state[node] = 1
+                path.append(node)
+                node = previous[node][0]
+            if state[node] == 1:
+                cycle = path[path.index(node):]
+                cycle.reverse()
+                self.add_loop(cycle, previous)
+            for node_path in path:
+                state[node_path] = 2
+
+    def add_loop(self, cycle, previous):
+        # Every currency of the cycle is reached from the one before it
+        gain = functools.reduce(operator.mul, [previous[node][1] for node in cycle], fractions.Fraction(1))
+        names = [self.names[node] for node in cycle]
+        self.add_named_loop(names + names[:1], gain)
+        for node in cycle:
+            self.unbounded[node] = 1
+
+    def add_named_loop(self, names, gain):
+        # names ends with its first currency; the loop is recorded once, from its
+        # smallest currency
+        names = names[:-1]
+        start = names.index(min(names))
+        names = names[start:] + names[:start]
+        key = (tuple(names), gain)
+        if gain > 1 and key not in self.loops_seen:
+            self.loops_seen.add(key)
+            self.loops.append((names + names[:1], gain))
+
+    def best_rate(self, currency_from, currency_to):
+        # (units of currency_to one unit of currency_from is worth, currencies of the path);
+        # KeyError when they are not connected, ConverterException when an arbitrage loop
+        # makes the rate unbounded
+        node_from, node_to = self.index[currency_from], self.index[currency_to]
+        if self.unbounded[node_from]:
+            raise ConverterException('exchange rate is unbounded, arbitrage loop reachable', currency_from, currency_to)
+        edges, potentials = self.edges, self.distances
+        distances = {node_from: 0.0}
+        previous = {node_from: None}
+        settled = set()
+        queue = [(0.0, 0, node_from)]
+        while queue:
+            distance, hops, node = heapq.heappop(queue)
+            if node in settled:
+                continue
+            settled.add(node)
+            if node == node_to:
+                break
+            potential = potentials[node]
+            for node_adj, weight, rate in edges[node]:
+                # Reduced weights are not negative without arbitrage, rounding aside
+                new_distance = distance + max(0.0, weight + potential - potentials[node_adj])
+                if new_distance < distances.get(node_adj, math.inf):
+                    distances[node_adj] = new_distance
+                    previous[node_adj] = (node, rate)
+                    heapq.heappush(queue, (new_distance, hops + 1, node_adj))
+                    # Nothing left in the queue is shorter than distance
+                    if node_adj == node_to and new_distance <= distance:
+                        queue = [(new_distance, hops + 1, node_adj)]
+        self.settled = len(settled)
+        if node_to not in settled:
+            raise KeyError(currency_from, currency_to)
+        path = [currency_to]
+        rate = fractions.Fraction(1)
+        node = node_to
+        while previous[node] is not None:
+            node, rate_edge = previous[node]
+            rate *= rate_edge
+            path.append(self.names[node])
+        path.reverse()
+        return rate, path
+
+
+class FractionTable(dict):
+    # keys -> Fraction(numerator, denominator), each built on first lookup
+    def __init__(self, keys, numerators, denominators):
+        dict.__init__(self)
+        self.positions = dict(zip(keys, range(len(numerators))))
+        self.numerators = numerators
+        self.denominators = denominators
+
+    def __missing__(self, key):
+        position = self.positions[key]
+        value = self[key] = fractions.Fraction(self.numerators[position], self.denominators[position])
+        return value
 
 
 class Converter(object):
-    def __init__(self):
+    # Snapshot file: header, then 'q' arrays: string offsets, numerators and denominators
+    # (root ratio of every currency, rate of every quote, values of every conflict;
+    # BIG_INTEGER marks one stored with the big integers), then 'i' arrays of string ids:
+    # token definitions (token, type, value), resolved tokens (token, digit), currencies
+    # (currency, union-find root), quotes (from, to), conflicts (from, to) and the byte
+    # lengths of the big integers; then the strings (UTF-8) and the big integers (little
+    # endian, signed)
+    MAGIC = b'T3CS'
+    VERSION = 1
+    HEADER = struct.Struct('<4sIBxxxQQQQQQQQ')
+    TOKEN_TYPES = ['roman_digit', 'alias']
+    BIG_INTEGER = -1 << 63
+
+    def __init__(self, cache_size=1024):
         self.token_map = TokenMap()
         self.currencies = dict()
-        self.xchg_graph = dict()
+        self.quotes = dict()
+        # (currencies from, currencies to, numerators, denominators) of a loaded snapshot, see xchg_graph
+        self.snapshot_quotes = None
+        # Weighted union-find over the currencies: parents[currency] and the value of one
+        # unit of currency in units of its parent (ratios), roots are their own parents.
+        # members lists the currencies of every root
+        self.parents = dict()
+        self.ratios = dict()
+        self.members = dict()
+        self.conflicts = list()
+        self.rate_cache = RateCache(cache_size)
+        # ExchangePaths over xchg_graph, built on first use and dropped by every new quote
+        self.exchange_paths = None
+
+    def find(self, currency):
+        # (root, value of one unit of currency in root units), compresses the path
+        parent = self.parents[currency]
+        if self.parents[parent] == parent:
+            return parent, self.ratios[currency]
+        path = list()
+        root = currency
+        while self.parents[root] != root:
+            path.append(root)
+            root = self.parents[root]
+        ratio = 1
+        for node in reversed(path):
+            ratio *= self.ratios[node]
+            self.parents[node] = root
+            self.ratios[node] = ratio
+        return root, self.ratios[currency]
+
+    @property
+    def xchg_graph(self):
+        # Quotes of a loaded snapshot only become graph edges when the graph is first used
+        if self.snapshot_quotes is not None:
+            quotes = self.snapshot_quotes
+            self.snapshot_quotes = None
+            for currency_from, currency_to, value_from, value_to in zip(*quotes):
+                self.quotes.setdefault(currency_from, dict())[currency_to] = {'rate': fractions.Fraction(value_from, value_to)}
+                self.quotes.setdefault(currency_to, dict())[currency_from] = {'rate': fractions.Fraction(value_to, value_from)}
+        return self.quotes
+
+    def save(self, path):
+        strings = dict()
+
+        def string_id(string):
+            return strings.setdefault(string, len(strings))
+
+        tokens = array.array('i')
+        for token, mapping in self.token_map.items.items():
+            tokens.extend((string_id(token), self.TOKEN_TYPES.index(mapping['type']), string_id(mapping['value'])))
+        resolved = array.array('i')
+        for token, digit in self.token_map.resolved.items():
+            resolved.extend((string_id(token), string_id(digit)))
+        fractions_saved = list()
+        currencies = array.array('i')
+        for currency in self.currencies:
+            root, ratio = self.find(currency)
+            currencies.extend((string_id(currency), string_id(root)))
+            fractions_saved.append((ratio.numerator, ratio.denominator))
+        quotes = array.array('i')
+        for currency_from, edges in self.xchg_graph.items():
+            for currency_to, edge in edges.items():
+                # One direction per pair, the other one is its inverse
+                if strings[currency_from] < strings[currency_to]:
+                    quotes.extend((strings[currency_from], strings[currency_to]))
+                    fractions_saved.append((edge['rate'].numerator, edge['rate'].denominator))
+        conflicts = array.array('i')
+        for currency_from, value_from, currency_to, value_to in self.conflicts:
+            # Values may be Fractions, the rate keeps the quote
+            rate = fractions.Fraction(value_from) / value_to
+            conflicts.extend((string_id(currency_from), string_id(currency_to)))
+            fractions_saved.append((rate.numerator, rate.denominator))
+
+        offsets = array.array('q', [0])
+        for string in strings:
+            offsets.append(offsets[-1] + len(string))
+        text = ''.join(strings).encode('utf-8')
+        big_integers = list()
+        columns = list()
+        for column in list(zip(*fractions_saved)) or [(), ()]:
+            packed = array.array('q')
+            for integer in column:
+                if self.BIG_INTEGER < integer < -self.BIG_INTEGER:
+                    packed.append(integer)
+                else:
+                    packed.append(self.BIG_INTEGER)
+                    big_integers.append(integer.to_bytes(integer.bit_length() // 8 + 1, 'little', signed=True))
+            columns.append(packed)
+        lengths = array.array('i', map(len, big_integers))
+        big_integers = b''.join(big_integers)
+        with open(path, 'wb') as snapshot_file:
+            snapshot_file.write(self.HEADER.pack(self.MAGIC, self.VERSION, sys.byteorder == 'little', len(strings), len(text),
+                                                 len(tokens) // 3, len(resolved) // 2, len(currencies) // 2, len(quotes) // 2,
+                                                 len(conflicts) // 2, len(big_integers)))
+            snapshot_file.write(bytes(-snapshot_file.tell() % 8))
+            for data in [offsets] + columns + [tokens, resolved, currencies, quotes, conflicts, lengths, text, big_integers]:
+                snapshot_file.write(bytes(data))
+
+    @classmethod
+    def load(cls, path, cache_size=1024):
+        # No line is parsed again: every section is unpacked in bulk from the mapped file,
+        # rate Fractions are built when first needed
+        with open(path, 'rb') as snapshot_file:
+            mapping = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, version, little_endian, string_count, text_size, token_count, resolved_count, currency_count,
+             quote_count, conflict_count, big_integers_size) = cls.HEADER.unpack_from(mapping, 0)
+            if magic != cls.MAGIC or version != cls.VERSION:
+                raise ConverterException('Unsupported snapshot file', path)
+            if bool(little_endian) != (sys.byteorder == 'little'):
+                raise ConverterException('Snapshot file byte order does not match this machine', path)
+            position = cls.HEADER.size + -cls.HEADER.size % 8
+            fraction_count = currency_count + quote_count + conflict_count
+            sections = list()
+            for typecode, count in (('q', string_count + 1), ('q', fraction_count), ('q', fraction_count),
+                                    ('i', 3 * token_count), ('i', 2 * resolved_count), ('i', 2 * currency_count),
+                                    ('i', 2 * quote_count), ('i', 2 * conflict_count), ('i', None)):
+                section = array.array(typecode)
+                if count is None:
+                    # Lengths of the big integers
+                    count = sections[1].count(cls.BIG_INTEGER) + sections[2].count(cls.BIG_INTEGER)
+                section.frombytes(mapping[position:position + section.itemsize * count])
+                sections.append(section)
+                position += section.itemsize * count
+            offsets, numerators, denominators, tokens, resolved, currencies, quotes, conflicts, lengths = sections
+            text = mapping[position:position + text_size].decode('utf-8')
+            position += text_size
+            numerators, denominators = numerators.tolist(), denominators.tolist()
+            lengths = iter(lengths)
+            for column in (numerators, denominators):
+                index = -1
+                for _ in range(column.count(cls.BIG_INTEGER)):
+                    index = column.index(cls.BIG_INTEGER, index + 1)
+                    length = next(lengths)
+                    column[index] = int.from_bytes(mapping[position:position + length], 'little', signed=True)
+                    position += length
+        finally:
+            mapping.close()
+
+        strings = [text[offsets[index]:offsets[index + 1]] for index in range(string_count)]
+        converter = cls(cache_size)
+        token_map = converter.token_map
+        token_types = [strings[index] for index in tokens[0::3]], tokens[1::3], [strings[index] for index in tokens[2::3]]
+        for token, token_type, value in zip(*token_types):
+            token_map.items[token] = {'type': cls.TOKEN_TYPES[token_type], 'value': value}
+            if token_type == 1:
+                token_map.aliases.setdefault(value, set()).add(token)
+        token_map.resolved = dict(zip([strings[index] for index in resolved[0::2]], [strings[index] for index in resolved[1::2]]))
+
+        names = [strings[index] for index in currencies[0::2]]
+        roots = [strings[index] for index in currencies[1::2]]
+        converter.currencies = dict((currency, dict()) for currency in names)
+        converter.parents = dict(zip(names, roots))
+        converter.ratios = FractionTable(names, numerators[:currency_count], denominators[:currency_count])
+        for currency, root in zip(names, roots):
+            converter.members.setdefault(root, list()).append(currency)
+        fraction_end = currency_count + quote_count
+        converter.snapshot_quotes = ([strings[index] for index in quotes[0::2]], [strings[index] for index in quotes[1::2]],
+                                     numerators[currency_count:fraction_end], denominators[currency_count:fraction_end])
+        converter.conflicts = list(zip([strings[index] for index in conflicts[0::2]], numerators[fraction_end:],
+                                       [strings[index] for index in conflicts[1::2]], denominators[fraction_end:]))
+        return converter
+
+    def get_component(self, currency):
+        if currency not in self.parents:
+            return currency
+        return self.find(currency)[0]
 
     def add_xchg(self, currency_from, value_from, currency_to, value_to):
+        # value_from units of currency_from are worth value_to units of currency_to. An
+        # accepted quote is kept in xchg_graph; ConverterException when it contradicts the
+        # rates already known for the two currencies, which stay unchanged, and the quote
+        # is kept in conflicts only
+        if value_from <= 0 or value_to <= 0:
+            raise ConverterException('exchange values must be positive')
         currencies = self.currencies
         currencies.setdefault(currency_from, dict())
         currencies.setdefault(currency_to, dict())
+        self.exchange_paths = None
+        for currency in (currency_from, currency_to):
+            if currency not in self.parents:
+                self.parents[currency] = currency
+                self.ratios[currency] = fractions.Fraction(1)
+                self.members[currency] = [currency]
+        root_from, ratio_from = self.find(currency_from)
+        root_to, ratio_to = self.find(currency_to)
+        if root_from == root_to:
+            if ratio_from * value_from != ratio_to * value_to:
+                self.conflicts.append((currency_from, value_from, currency_to, value_to))
+                raise ConverterException('exchange rate contradicts the known rates', currency_from, currency_to,
+                                         ratio_from / ratio_to, fractions.Fraction(value_to, value_from))
         xchg_graph = self.xchg_graph
         xchg_graph.setdefault(currency_from, dict()).setdefault(currency_to, dict())['rate'] = fractions.Fraction(value_from, value_to)
         xchg_graph.setdefault(currency_to, dict()).setdefault(currency_from, dict())['rate'] = fractions.Fraction(value_to, value_from)
+        if root_from == root_to:
+            return
+        self.rate_cache.invalidate(root_from)
+        self.rate_cache.invalidate(root_to)
+        # The smaller component hangs below the root of the larger one
+        if len(self.members[root_from]) < len(self.members[root_to]):
+            self.parents[root_from] = root_to
+            self.ratios[root_from] = fractions.Fraction(value_to) * ratio_to / (value_from * ratio_from)
+            self.members[root_to].extend(self.members.pop(root_from))
+        else:
+            self.parents[root_to] = root_from
+            self.ratios[root_to] = fractions.Fraction(value_from) * ratio_from / (value_to * ratio_to)
+            self.members[root_from].extend(self.members.pop(root_to))
+
+    def get_rate(self, currency_from, currency_to):
+        # Units of currency_to one unit of currency_from is worth, KeyError when the two
+        # are not connected
+        if currency_from not in self.parents or currency_to not in self.parents:
+            raise KeyError(currency_from, currency_to)
+        root_from, ratio_from = self.find(currency_from)
+        root_to, ratio_to = self.find(currency_to)
+        if root_from != root_to:
+            raise KeyError(currency_from, currency_to)
+        return ratio_from / ratio_to
 
     def get_xchg(self, currency_from, value_from, currency_to):
-        xchg_graph = self.xchg_graph
-        if currency_to in xchg_graph and currency_from in xchg_graph[currency_to]:
-            return float(xchg_graph[currency_to][currency_from]['rate'] * value_from)
+        key = (currency_from, currency_to)
+        rate = self.rate_cache.get(key)
+        if rate is None:
+            try:
+                rate = self.get_rate(currency_from, currency_to)
+            except KeyError:
+                rate = math.inf
+            self.rate_cache.put(key, rate, set([self.get_component(currency_from), self.get_component(currency_to)]))
+        if math.isinf(rate):
+            raise KeyError
+        return value_from * rate
+
+    def get_exchange_paths(self):
+        if self.exchange_paths is None:
+            potentials = dict((currency, fraction_log(self.find(currency)[1])) for currency in self.currencies)
+            self.exchange_paths = ExchangePaths(self.xchg_graph, self.conflicts, potentials)
+        return self.exchange_paths
+
+    def best_xchg(self, currency_from, value_from, currency_to):
+        # (value in currency_to along the best rate path, currencies of the path), see
+        # ExchangePaths.best_rate; KeyError first when the two are not connected at all
+        self.get_rate(currency_from, currency_to)
+        rate, path = self.get_exchange_paths().best_rate(currency_from, currency_to)
+        return value_from * rate, path
+
+    def arbitrage_loops(self):
+        return self.get_exchange_paths().loops
+
+    def convert_all(self, currency_from, value_from):
+        # Exact value of value_from units of currency_from in every currency connected to
+        # it (currency_from included), one pass over its component
+        if currency_from not in self.parents:
+            raise KeyError(currency_from)
+        root, ratio_from = self.find(currency_from)
+        value = value_from * ratio_from
+        return dict((currency, value / self.find(currency)[1]) for currency in self.members[root])
+
+    def convert_all_fixed(self, currency_from, value_from, places=6, rounding=decimal.ROUND_HALF_EVEN):
+        # convert_all for bulk output: (currencies sorted, array of the values times
+        # 10 ** places rounded to integers), OverflowError above 64 bits
+        if currency_from not in self.parents:
+            raise KeyError(currency_from)
+        root, ratio_from = self.find(currency_from)
+        value = fractions.Fraction(value_from) * ratio_from
+        numerator, denominator = value.numerator * 10 ** places, value.denominator
+        currencies = sorted(self.members[root])
+        fixed = array.array('q')
+        for currency in currencies:
+            ratio = self.find(currency)[1]
+            fixed.append(divide_rounded(numerator * ratio.denominator, denominator * ratio.numerator, rounding))
+        return currencies, fixed
+
+    # Sinks: answers go to output, warnings to errors (sys.stdout and sys.stderr when None)
+    output = None
+    errors = None
+
+    def error(self, text):
+        (self.errors or sys.stderr).write('%s\n' % text)
+
+    def warn(self, message, line=None):
+        if line is None:
+            self.error(message)
         else:
-            processor = ConverterProcessed(self.currencies, xchg_graph, currency_from)
-            rate = processor.get_node_rate(currency_to)
-            if math.isinf(rate):
-                raise KeyError
-            return value_from * rate
+            self.error('WARNING: %s, line ignored. Line: %s' % (message, line))
 
-    def process_line(self, line):
-        token_map = self.token_map
-        xchg_graph = self.xchg_graph
+    def answer(self, text):
+        (self.output or sys.stdout).write('%s\n' % text)
+
+    def classify(self, tokens, is_index):
+        # Handler key of a line: "how much", "how many" and "how ..." questions, alias and
+        # rate assignments
+        if tokens[0] == 'how':
+            return tokens[1] in ('much', 'many') and 'how ' + tokens[1] or 'how'
+        if is_index == 0:
+            return 'assignment'
+        return is_index == 1 and 'alias' or 'rate'
 
+    def process_line(self, line):
+        # Tokenizes the line once and dispatches on its kind
         line = line.strip()
-        tokens = list(map(lambda token: token.strip(), line.split(' ')))
+        if line.isprintable():
+            # No whitespace but spaces, the tokens need no strip
+            tokens = line.split(' ')
+        else:
+            tokens = [token.strip() for token in line.split(' ')]
         if len(tokens) < 3:
-            sys.stderr.write('WARNING: too few tokens, line ignored. Line: %s\n' % line)
+            self.warn('too few tokens', line)
             return
         try:
             is_index = tokens.index('is')
         except ValueError:
-            sys.stderr.write('WARNING: line has no "is" token, line ignored. Line: %s\n' % line)
+            self.warn('line has no "is" token', line)
             return
+        self.handlers[self.classify(tokens, is_index)](self, line, tokens, is_index)
 
-        if tokens[0] == 'how':
-            # query clause
-            if tokens[1] == 'much':
-                lvalue = tokens[2:is_index]
-                if lvalue:  # extra tokens between "how much" and "is"
-                    sys.stderr.write('WARNING: extra tokens between "how much" and "is", line ignored. Line: %s\n' % line)
-                    return
-                if tokens[-1] != '?':
-                    sys.stderr.write('WARNING: no question mark in question, line ignored. Line: %s\n' % line)
-                    return
-                rvalue = tokens[is_index + 1:-1]  # strip "?"
-                try:
-                    roman_value = list(token_map.lookup_tokens(rvalue))
-                except ValueError:
-                    sys.stderr.write('WARNING: currency assignment left clause has unknown alias, line ignored. Line: %s\n' % line)
-                    return
-                try:
-                    numeric_value = roman_to_int(''.join(roman_value))
-                except ValueError:
-                    sys.stderr.write('WARNING: roman number conversion failed, line ignored. Line: %s\n' % line)
-                    return
-                # response on "how much" question
-                print('%s is %d' % (' '.join(rvalue), numeric_value))
-            elif tokens[1] == 'many':
-                lvalue = tokens[2:is_index]
-                if len(lvalue) != 1:  # extra tokens between "how much" and "is"
-                    sys.stderr.write('WARNING: currency name should be exact one token, line ignored. Line: %s\n' % line)
-                    return
-                currency_to = lvalue[0]
-                if tokens[-1] != '?':
-                    sys.stderr.write('WARNING: no question mark in question, line ignored. Line: %s\n' % line)
-                    return
-                rvalue = tokens[is_index + 1:-1]  # strip "?"
-                if len(rvalue) < 2:
-                    sys.stderr.write('WARNING: right clause must have at least one digit and a currency token, line ignored. Line: %s\n' % line)
-                    return
-                currency_from = rvalue[-1]
-                try:
-                    numbers_from = list(token_map.lookup_tokens(rvalue[:-1]))
-                except ValueError:
-                    sys.stderr.write('WARNING: right clause has wrong roman aliased number, line ignored. Line: %s\n' % line)
-                    return
-                try:
-                    value_from = roman_to_int(''.join(numbers_from))
-                except ValueError:
-                    sys.stderr.write('WARNING: right clause has wrong roman aliased number, line ignored. Line: %s\n' % line)
-                    return
-                # response on "how many" question
-                try:
-                    print('%s is %f %s' % (' '.join(rvalue), self.get_xchg(currency_from, value_from, currency_to), currency_to))
-                except KeyError:
-                    sys.stderr.write('WARNING: no exchange rates for the specied currency. Line: %s\n' % line)
-                    return
-            else:
-                sys.stderr.write('I have no idea what you are talking about\n')
-                return
+    def process_how_much(self, line, tokens, is_index):
+        if is_index != 2:  # extra tokens between "how much" and "is"
+            self.warn('extra tokens between "how much" and "is"', line)
+            return
+        if tokens[-1] != '?':
+            self.warn('no question mark in question', line)
+            return
+        rvalue = tokens[is_index + 1:-1]  # strip "?"
+        try:
+            roman_value = list(self.token_map.lookup_tokens(rvalue))
+        except ValueError:
+            self.warn('currency assignment left clause has unknown alias', line)
+            return
+        try:
+            numeric_value = roman_to_int(''.join(roman_value))
+        except ValueError:
+            self.warn('roman number conversion failed', line)
+            return
+        # response on "how much" question
+        self.answer('%s is %d' % (' '.join(rvalue), numeric_value))
+
+    def process_how_many(self, line, tokens, is_index):
+        if is_index != 3:  # extra tokens between "how much" and "is"
+            self.warn('currency name should be exact one token', line)
+            return
+        currency_to = tokens[2]
+        if tokens[-1] != '?':
+            self.warn('no question mark in question', line)
+            return
+        rvalue = tokens[is_index + 1:-1]  # strip "?"
+        if len(rvalue) < 2:
+            self.warn('right clause must have at least one digit and a currency token', line)
+            return
+        currency_from = rvalue[-1]
+        try:
+            numbers_from = list(self.token_map.lookup_tokens(rvalue[:-1]))
+            value_from = roman_to_int(''.join(numbers_from))
+        except ValueError:
+            self.warn('right clause has wrong roman aliased number', line)
+            return
+        # response on "how many" question
+        try:
+            value = to_fixed(self.get_xchg(currency_from, value_from, currency_to), 6)
+            self.answer('%s is %s %s' % (' '.join(rvalue), format_fixed(value, 6), currency_to))
+        except KeyError:
+            self.error('WARNING: no exchange rates for the specied currency. Line: %s' % line)
+
+    def process_how(self, line, tokens, is_index):
+        self.warn('I have no idea what you are talking about')
+
+    def process_assignment(self, line, tokens, is_index):
+        self.warn('line has wrong assignment', line)
+
+    def process_alias(self, line, tokens, is_index):
+        rvalue = tokens[is_index + 1:]
+        if len(rvalue) != 1:
+            self.warn('mapping of alias to two tokens is not yet supported', line)
+        elif rvalue[0] in ROMAN_DIGITS:
+            self.token_map.add_digit(tokens[0], rvalue[0])
         else:
-            # assignment clause
-            lvalue = tokens[:is_index]
-            rvalue = tokens[is_index + 1:]
-            if not lvalue:
-                sys.stderr.write('WARNING: line has wrong assignment, line ignored. Line: %s\n' % line)
-                return
-            if len(lvalue) == 1:
-                # alias assignment
-                if len(rvalue) == 1 and (rvalue[0] in ['I', 'V', 'X', 'L', 'C', 'D', 'M']):
-                    token_map.add_digit(lvalue[0], rvalue[0])
-                elif len(rvalue) == 1:
-                    token_map.add_alias(lvalue[0], rvalue[0])
-                else:
-                    sys.stderr.write('WARNING: mapping of alias to two tokens is not yet supported, line ignored. Line: %s\n' % line)
-                    return
-            else:
-                # currency exchange assignment
-                if len(rvalue) != 2:
-                    sys.stderr.write('WARNING: currency assignment right clause must have value and currency, line ignored. Line: %s\n' % line)
-                    return
-                try:
-                    numbers_from = list(token_map.lookup_tokens(lvalue[:-1]))
-                except ValueError:
-                    sys.stderr.write('WARNING: currency assignment left clause has unknown alias, line ignored. Line: %s\n' % line)
-                    return
-                try:
-                    value_from = roman_to_int(''.join(numbers_from))
-                except ValueError:
-                    sys.stderr.write('WARNING: currency assignment left clause has wrong roman aliased number, line ignored. Line: %s\n' % line)
-                    return
-                currency_from = lvalue[-1]
-                try:
-                    value_to = int(rvalue[0])
-                except (TypeError, ValueError):
-                    sys.stderr.write('WARNING: currency assignment right clause must have decimal value, line ignored. Line: %s\n' % line)
-                    return
-                currency_to = rvalue[1]
-                # currency exchange graph assignment
-                self.add_xchg(currency_from, value_from, currency_to, value_to)
+            self.token_map.add_alias(tokens[0], rvalue[0])
+
+    def process_rate(self, line, tokens, is_index):
+        # currency exchange assignment
+        lvalue = tokens[:is_index]
+        rvalue = tokens[is_index + 1:]
+        if len(rvalue) != 2:
+            self.warn('currency assignment right clause must have value and currency', line)
+            return
+        try:
+            numbers_from = list(self.token_map.lookup_tokens(lvalue[:-1]))
+        except ValueError:
+            self.warn('currency assignment left clause has unknown alias', line)
+            return
+        try:
+            value_from = roman_to_int(''.join(numbers_from))
+        except ValueError:
+            self.warn('currency assignment left clause has wrong roman aliased number', line)
+            return
+        currency_from = lvalue[-1]
+        try:
+            value_to = int(rvalue[0])
+        except (TypeError, ValueError):
+            self.warn('currency assignment right clause must have decimal value', line)
+            return
+        currency_to = rvalue[1]
+        # currency exchange graph assignment
+        try:
+            self.add_xchg(currency_from, value_from, currency_to, value_to)
+        except ConverterException as e:
+            self.error('WARNING: %s, known rates kept. Line: %s' % (e.args[0], line))
+
+    handlers = {
+        'how much': process_how_much,
+        'how many': process_how_many,
+        'how': process_how,
+        'assignment': process_assignment,
+        'alias': process_alias,
+        'rate': process_rate,
+    }
+
+
+class ConverterException(Exception):
+    pass
+
+
+class StreamProcessor(object):
+    # Feeds a stream to Converter.process_line as it arrives: reads whatever input is
+    # available (at most chunk_size), answers its complete lines into buffers and
+    # flushes them with one write each before reading again. Memory stays bounded by
+    # chunk_size however long the stream runs, answers never wait for more input
+    def __init__(self, converter, output=None, errors=None, chunk_size=1 << 16):
+        self.converter = converter
+        self.output = output or sys.stdout
+        self.errors = errors or sys.stderr
+        self.chunk_size = chunk_size
+        # Counters: lines and chunks processed, seconds spent from reading a chunk to
+        # flushing its answers (latency, total and worst), seconds of the whole run
+        self.lines = 0
+        self.chunks = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.elapsed = 0.0
+
+    def chunks_of(self, stream):
+        # Text chunks as they arrive; read1 on binary streams returns what is available
+        # without waiting for a full chunk
+        stream = getattr(stream, 'buffer', stream)
+        read = getattr(stream, 'read1', stream.read)
+        decoder = None
+        while True:
+            chunk = read(self.chunk_size)
+            if not chunk:
+                break
+            if isinstance(chunk, bytes):
+                decoder = decoder or codecs.getincrementaldecoder('utf-8')()
+                chunk = decoder.decode(chunk)
+            yield chunk
+        if decoder is not None:
+            # UnicodeDecodeError when the input ends inside a character
+            decoder.decode(b'', True)
+
+    def run(self, stream):
+        converter = self.converter
+        output, errors = io.StringIO(), io.StringIO()
+        converter.output, converter.errors = output, errors
+        started = time.perf_counter()
+        rest = ''
+        try:
+            for chunk in self.chunks_of(stream):
+                arrived = time.perf_counter()
+                lines = (rest + chunk).split('\n')
+                rest = lines.pop()
+                for line in lines:
+                    converter.process_line(line)
+                self.lines += len(lines)
+                self.chunks += 1
+                self.flush(output, errors)
+                latency = time.perf_counter() - arrived
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+            if rest:
+                converter.process_line(rest)
+                self.lines += 1
+                self.flush(output, errors)
+        finally:
+            converter.output, converter.errors = None, None
+            self.elapsed += time.perf_counter() - started
+
+    def flush(self, output, errors):
+        for buffer, stream in ((output, self.output), (errors, self.errors)):
+            text = buffer.getvalue()
+            if text:
+                stream.write(text)
+                stream.flush()
+                buffer.seek(0)
+                buffer.truncate()
+
+    def stats(self):
+        return {
+            'lines': self.lines,
+            'chunks': self.chunks,
+            'lines_per_second': self.elapsed and self.lines / self.elapsed or 0.0,
+            'latency_mean': self.chunks and self.latency_total / self.chunks or 0.0,
+            'latency_max': self.latency_max,
+        }
 
 
 def main():
-    converter = Converter()
-    for line in sys.stdin.readlines():
-        converter.process_line(line)
+    parser = argparse.ArgumentParser(description='Roman numerals and currency exchange, lines on stdin')
+    parser.add_argument('--stats', action='store_true', help='report throughput and latency on stderr')
+    parser.add_argument('--load-snapshot', help='start from the state saved in this snapshot file')
+    parser.add_argument('--save-snapshot', help='save the state to this snapshot file after the input')
+    parser.add_argument('--arbitrage', action='store_true', help='report the arbitrage loops of the quotes on stderr')
+    args = parser.parse_args()
+
+    converter = args.load_snapshot and Converter.load(args.load_snapshot) or Converter()
+    processor = StreamProcessor(converter)
+    processor.run(sys.stdin)
+    if args.save_snapshot:
+        converter.save(args.save_snapshot)
+    if args.arbitrage:
+        for loop, gain in converter.arbitrage_loops():
+            converter.warn('arbitrage loop: %s, gain %s' % (' -> '.join(loop), format_fixed(to_fixed(gain))))
+    if args.stats:
+        stats = processor.stats()
+        sys.stderr.write('%d lines in %d chunks, %.0f lines/s, latency mean %.3fms, max %.3fms\n' % (
+            stats['lines'], stats['chunks'], stats['lines_per_second'], stats['latency_mean'] * 1000, stats['latency_max'] * 1000))
 
 
 if __name__ == '__main__':